@@ -0,0 +1,87 @@
+"""
+Benchmarks the censor WordMatcher against the previous per-term loops, checking both give the
+same verdicts. Run from 'src' with: poetry run python -m benchmarks.censor_matcher
+"""
+from random import Random
+from string import ascii_lowercase
+from time import perf_counter
+from typing import List
+
+from word_filter import WordMatcher
+
+TERM_COUNTS = [10, 100, 1000, 5000]
+MESSAGE_COUNT = 2000
+
+
+def reference_should_censor(
+    text: str,
+    words_startswith: List[str],
+    words_inside_words: List[str],
+    words_independent: List[str],
+) -> bool:
+    """
+    The original Censor.should_censor_message matching, kept as the correctness reference.
+    """
+    censor = False
+    split_message = text.split(" ")
+    for word in split_message:
+        for censored_word in words_startswith:
+            if word.startswith(censored_word):
+                censor = True
+                break
+        for whole_censored_word in words_inside_words:
+            if whole_censored_word in word:
+                censor = True
+                break
+        if censor:
+            break
+    if not censor and any(word in split_message for word in words_independent):
+        censor = True
+    return censor
+
+
+def random_word(rng: Random, min_length: int, max_length: int) -> str:
+    length = rng.randint(min_length, max_length)
+    return "".join(rng.choice(ascii_lowercase) for _ in range(length))
+
+
+def main():
+    rng = Random(1337)  # nosec
+    messages = [
+        " ".join(random_word(rng, 1, 9) for _ in range(rng.randint(1, 25)))
+        for _ in range(MESSAGE_COUNT)
+    ]
+
+    print(f"{'terms':>6} {'reference us/msg':>17} {'matcher us/msg':>15} {'hits':>6}")
+    for term_count in TERM_COUNTS:
+        per_list = term_count // 3
+        words_startswith = [random_word(rng, 4, 7) for _ in range(per_list)]
+        words_inside_words = [random_word(rng, 5, 8) for _ in range(per_list)]
+        words_independent = [random_word(rng, 2, 6) for _ in range(per_list)]
+        matcher = WordMatcher(words_startswith, words_inside_words, words_independent)
+
+        start = perf_counter()
+        expected = [
+            reference_should_censor(
+                message, words_startswith, words_inside_words, words_independent
+            )
+            for message in messages
+        ]
+        reference_time = perf_counter() - start
+
+        start = perf_counter()
+        actual = [matcher.matches(message) for message in messages]
+        matcher_time = perf_counter() - start
+
+        if actual != expected:
+            raise AssertionError(
+                f"Verdicts differ from reference at {term_count} terms"
+            )
+        print(
+            f"{term_count:>6} {reference_time / MESSAGE_COUNT * 1e6:>17.1f} "
+            f"{matcher_time / MESSAGE_COUNT * 1e6:>15.1f} {sum(actual):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Local stand-in for the Minecraft host: RCON, Server List Ping and a minimal FTP server serving a
+synthetic plugins/Essentials/userdata tree, with configurable latency and failure injection.
+Run from 'src' with: poetry run python -m benchmarks.fake_minecraft_server --players 5000
+"""
+import json
+from argparse import ArgumentParser
+from asyncio import (
+    AbstractServer,
+    Future,
+    StreamReader,
+    StreamWriter,
+    get_running_loop,
+    run,
+    sleep,
+    start_server,
+)
+from random import Random
+from struct import pack, unpack
+from time import gmtime, strftime, time
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from essentials_mirror import ESSENTIALS_USERDATA_PATH
+from server_ping import encode_packet, encode_varint, read_varint
+
+RCON_PASSWORD = "fake_rcon_password"  # nosec
+FTP_USERNAME = "fake_ftp_username"
+FTP_PASSWORD = "fake_ftp_password"  # nosec
+COLOR_CODES = "0123456789abcdef"
+
+
+class FakeMinecraftServer:
+    def __init__(
+        self,
+        players: int = 1000,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        seed: int = 1337,
+    ):
+        self.host = host
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = Random(seed)  # nosec
+
+        self.rcon_port = 0
+        self.ftp_port = 0
+        self.slp_port = 0
+        self.servers: List = []
+        self.rcon_commands_received = 0
+        self.ftp_files_sent = 0
+        self.slp_pings = 0
+
+        # Synthetic userdata: file name -> (contents, modification time)
+        self.player_uuids: List[str] = []
+        self.userdata: Dict[str, Tuple[bytes, float]] = {}
+        for index in range(players):
+            uuid = str(UUID(int=self.rng.getrandbits(128), version=4))
+            self.player_uuids.append(uuid)
+            self.set_nickname(uuid, f"Player{index}")
+
+    def set_nickname(self, uuid: str, name: str):
+        color = self.rng.choice(COLOR_CODES)
+        contents = (
+            f"timestamps:\n  login: {int(time() * 1000)}\n"
+            f"money: '0'\nnickname: '§{color}{name}'\nlastAccountName: {name}\n"
+        )
+        self.userdata[f"{uuid}.yml"] = (contents.encode("utf-8"), time())
+
+    def touch_players(self, count: int):
+        """
+        Changes the nickname of 'count' random players, as if they ran /nick in-game.
+        """
+        for uuid in self.rng.sample(
+            self.player_uuids, min(count, len(self.player_uuids))
+        ):
+            self.set_nickname(uuid, f"Renamed{self.rng.randint(0, 99999)}")
+
+    async def start(self):
+        for handler, attribute in (
+            (self.handle_rcon, "rcon_port"),
+            (self.handle_ftp, "ftp_port"),
+            (self.handle_slp, "slp_port"),
+        ):
+            server = await start_server(handler, self.host, 0)
+            self.servers.append(server)
+            setattr(self, attribute, server.sockets[0].getsockname()[1])
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+    async def inject_latency_and_failure(self) -> bool:
+        """
+        Sleeps for the configured latency, then returns True if this request should fail.
+        """
+        if self.latency:
+            await sleep(self.latency)
+        return self.rng.random() < self.failure_rate
+
+    # RCON
+
+    async def handle_rcon(self, reader: StreamReader, writer: StreamWriter):
+        authenticated = False
+        try:
+            while True:
+                (length,) = unpack("<i", await reader.readexactly(4))
+                payload = await reader.readexactly(length)
+                request_id, packet_type = unpack("<ii", payload[:8])
+                body = payload[8:-2].decode("utf-8")
+
+                if await self.inject_latency_and_failure():
+                    break  # Drop the connection
+
+                if packet_type == 3:
+                    authenticated = body == RCON_PASSWORD
+                    response_id, response_type, response = (
+                        request_id if authenticated else -1,
+                        2,
+                        b"",
+                    )
+                elif not authenticated:
+                    break
+                else:
+                    self.rcon_commands_received += 1
+                    response_id, response_type, response = request_id, 0, b""
+                writer.write(
+                    pack("<iii", len(response) + 10, response_id, response_type)
+                    + response
+                    + b"\x00\x00"
+                )
+                await writer.drain()
+        except Exception:  # Client went away
+            pass
+        finally:
+            writer.close()
+
+    # Server List Ping
+
+    async def handle_slp(self, reader: StreamReader, writer: StreamWriter):
+        try:
+            await read_varint(reader)  # Handshake length
+            await read_varint(reader)  # Handshake packet id
+            await read_varint(reader)  # Protocol version
+            await reader.readexactly(await read_varint(reader))  # Host
+            await reader.readexactly(2)  # Port
+            await read_varint(reader)  # Next state
+            await read_varint(reader)  # Status request length
+            await read_varint(reader)  # Status request packet id
+
+            if await self.inject_latency_and_failure():
+                return
+            self.slp_pings += 1
+            status = json.dumps(
+                {
+                    "version": {"name": "Fake 1.18.2", "protocol": 758},
+                    "players": {"max": 100, "online": self.rng.randint(0, 100)},
+                    "description": {"text": "Fake Minecraft server"},
+                }
+            ).encode("utf-8")
+            writer.write(encode_packet(0x00, encode_varint(len(status)) + status))
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    # FTP (just the commands ftplib uses for our operations)
+
+    async def handle_ftp(self, reader: StreamReader, writer: StreamWriter):
+        data_connection: Optional[Future] = None
+        data_server: Optional[AbstractServer] = None
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode("utf-8"))
+            await writer.drain()
+
+        async def send_data(payload: bytes):
+            nonlocal data_connection, data_server
+            if data_connection is None:
+                await reply("425 Use PASV first")
+                return
+            await reply("150 Opening data connection")
+            _, data_writer = await data_connection
+            data_writer.write(payload)
+            await data_writer.drain()
+            data_writer.close()
+            if data_server is not None:
+                data_server.close()
+            data_connection, data_server = None, None
+            await reply("226 Transfer complete")
+
+        try:
+            await reply("220 Fake FTP server")
+            while True:
+                line = (await reader.readline()).decode("utf-8").rstrip("\r\n")
+                if not line:
+                    break
+                command, _, argument = line.partition(" ")
+                command = command.upper()
+
+                if await self.inject_latency_and_failure():
+                    break
+
+                if command == "USER":
+                    await reply("331 Password required")
+                elif command == "PASS":
+                    if argument == FTP_PASSWORD:
+                        await reply("230 Logged in")
+                    else:
+                        await reply("530 Login incorrect")
+                elif command in ("TYPE", "NOOP", "OPTS"):
+                    await reply("200 OK")
+                elif command == "PASV":
+                    connected: Future = get_running_loop().create_future()
+
+                    async def accept(data_reader, data_writer, connected=connected):
+                        if not connected.done():
+                            connected.set_result((data_reader, data_writer))
+
+                    data_server = await start_server(accept, self.host, 0)
+                    data_connection = connected
+                    port = data_server.sockets[0].getsockname()[1]
+                    address = self.host.replace(".", ",")
+                    await reply(
+                        f"227 Entering Passive Mode ({address},{port >> 8},{port & 0xFF})"
+                    )
+                elif command == "RETR":
+                    name = argument.rsplit("/", 1)[-1]
+                    if name not in self.userdata:
+                        await reply("550 No such file")
+                        continue
+                    self.ftp_files_sent += 1
+                    await send_data(self.userdata[name][0])
+                elif command in ("MLSD", "LIST"):
+                    if argument.rstrip("/") != ESSENTIALS_USERDATA_PATH:
+                        await reply("550 No such directory")
+                        continue
+                    await send_data(self.directory_listing(command == "MLSD"))
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except Exception:
+            pass
+        finally:
+            if data_server is not None:
+                data_server.close()
+            writer.close()
+
+    def directory_listing(self, machine_readable: bool) -> bytes:
+        lines = []
+        for name, (contents, modified) in self.userdata.items():
+            if machine_readable:
+                timestamp = strftime("%Y%m%d%H%M%S", gmtime(modified))
+                lines.append(
+                    f"type=file;size={len(contents)};modify={timestamp}; {name}"
+                )
+            else:
+                timestamp = strftime("%b %d %H:%M", gmtime(modified))
+                lines.append(f"-rw-r--r-- 1 mc mc {len(contents)} {timestamp} {name}")
+        return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+async def serve(args):
+    server = FakeMinecraftServer(args.players, args.latency, args.failure_rate)
+    await server.start()
+    print(f"RCON:  {server.host}:{server.rcon_port} (password '{RCON_PASSWORD}')")
+    print(f"FTP:   {server.host}:{server.ftp_port} ({FTP_USERNAME} / {FTP_PASSWORD})")
+    print(f"Ping:  {server.host}:{server.slp_port}")
+    while True:
+        await sleep(60)
+
+
+def main():
+    parser = ArgumentParser(description="Fake Minecraft server for load-testing.")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request"
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Load scenario for the Minecraft integration: runs the real MinecraftIntegration and Store cogs
+against the local fake Minecraft server, driving in-game chat relays, nickname sync and store
+purchases, and reports throughput with p50/p99 latencies. Run from 'src' with:
+poetry run python -m benchmarks.minecraft_load --players 2000 --latency 0.005
+"""
+from argparse import ArgumentParser
+from asyncio import gather, run, sleep
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir, environ
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fake_minecraft_server import (
+    FTP_PASSWORD,
+    FTP_USERNAME,
+    RCON_PASSWORD,
+    FakeMinecraftServer,
+)
+from cogs.censor import Censor
+from cogs.minecraft_integration import MinecraftIntegration
+from cogs.store import Store
+from status_snapshot import STATUS_SNAPSHOT_PATH, StatusSnapshotWriter
+from utils import json_load_eval
+
+SRC_PATH = Path(__file__).resolve().parent.parent
+INGAME_CHANNEL_ID = 1
+BOT_USER_ID = 2
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, name: str):
+        self.id = channel_id
+        self.name = name
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeMember:
+    def __init__(self, member_id: int, display_name: str):
+        self.id = member_id
+        self.display_name = display_name
+        self.name = display_name
+        self.discriminator = "0001"
+        self.bot = False
+        self.roles: List[Any] = []
+        self.edits = 0
+
+    async def edit(self, nick: str):
+        self.display_name = nick
+        self.edits += 1
+
+    async def send(self, *args, **kwargs):
+        pass
+
+    async def add_roles(self, *roles):
+        pass
+
+    async def remove_roles(self, *roles):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, author: FakeMember, channel: FakeChannel, content: str):
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.clean_content = content
+        self.mention_everyone = False
+        self.guild = object()
+        self.reactions: List[str] = []
+
+    async def delete(self):
+        pass
+
+    async def add_reaction(self, emoji: str):
+        self.reactions.append(emoji)
+
+
+def make_bot(members: Dict[int, FakeMember], channels: Dict[str, FakeChannel]):
+    with open(SRC_PATH / "config_default.json", "r", encoding="utf-8") as config_file:
+        cfg = json_load_eval(config_file)
+
+    cogs: Dict[str, Any] = {
+        "MinimumRole": SimpleNamespace(
+            check_member_has_minimum_role=lambda member: True
+        )
+    }
+
+    async def change_presence(**kwargs):
+        pass
+
+    bot = SimpleNamespace(
+        CFG=cfg,
+        status_snapshot=StatusSnapshotWriter(Path.cwd() / STATUS_SNAPSHOT_PATH),
+        channels=channels,
+        roles={},
+        guild=SimpleNamespace(
+            get_member=members.get, text_channels=list(channels.values())
+        ),
+        client=SimpleNamespace(
+            get_cog=cogs.get,
+            user=SimpleNamespace(id=BOT_USER_ID),
+            change_presence=change_presence,
+        ),
+    )
+    return bot, cogs
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+def report(name: str, latencies: List[float], failures: int, elapsed: float):
+    """
+    Throughput and latencies only count successful operations, failures are listed apart.
+    """
+    if not latencies:
+        print(f"{name:<28} {0:>6} ops  {failures:>6} failed")
+        return
+    print(
+        f"{name:<28} {len(latencies):>6} ops  {failures:>6} failed  "
+        f"{len(latencies) / elapsed:>9.1f} ops/s  "
+        f"p50 {percentile(latencies, 0.50):>8.2f} ms  p99 {percentile(latencies, 0.99):>8.2f} ms"
+    )
+
+
+async def timed(function, *args) -> Tuple[float, bool]:
+    """
+    Returns the call's latency and whether it succeeded (didn't raise or return False).
+    """
+    start = perf_counter()
+    try:
+        succeeded = await function(*args) is not False
+    except Exception:
+        succeeded = False
+    return perf_counter() - start, succeeded
+
+
+async def run_concurrently(name: str, calls: List, concurrency: int):
+    latencies: List[float] = []
+    failures = 0
+    start = perf_counter()
+    with redirect_stdout(StringIO()):  # The cogs print every RCON response
+        for index in range(0, len(calls), concurrency):
+            results = await gather(
+                *(timed(*call) for call in calls[index : index + concurrency])
+            )
+            for latency, succeeded in results:
+                if succeeded:
+                    latencies.append(latency)
+                else:
+                    failures += 1
+    report(name, latencies, failures, perf_counter() - start)
+
+
+async def scenario(args):
+    server = FakeMinecraftServer(args.players, args.latency, args.failure_rate)
+    await server.start()
+    environ.update(
+        {
+            "MINECRAFT_FTP_HOST": server.host,
+            "MINECRAFT_FTP_PORT": str(server.ftp_port),
+            "MINECRAFT_FTP_USERNAME": FTP_USERNAME,
+            "MINECRAFT_FTP_PASSWORD": FTP_PASSWORD,
+            "MINECRAFT_RCON_HOST": server.host,
+            "MINECRAFT_RCON_PORT": str(server.rcon_port),
+            "MINECRAFT_RCON_PASSWORD": RCON_PASSWORD,
+            "MINECRAFT_SERVER_PORT": str(server.slp_port),
+        }
+    )
+
+    channels = {
+        name: FakeChannel(channel_id, name)
+        for channel_id, name in enumerate(
+            ("store_backend", "store_log", "admin"), start=INGAME_CHANNEL_ID + 1
+        )
+    }
+    ingame_channel = FakeChannel(INGAME_CHANNEL_ID, "in_game")
+    channels["in_game"] = ingame_channel
+    members = {
+        discord_id: FakeMember(discord_id, f"Member{discord_id}")
+        for discord_id in range(1000, 1000 + args.players)
+    }
+    bot, cogs = make_bot(members, channels)
+
+    with redirect_stdout(StringIO()):
+        cogs["Censor"] = Censor(bot)
+        integration = MinecraftIntegration(bot)
+        cogs["MinecraftIntegration"] = integration
+        for discord_id, uuid in zip(members, server.player_uuids):
+            integration.discord_to_minecraft[discord_id] = {
+                "minecraft_name": f"Player{discord_id - 1000}",
+                "minecraft_uuid": uuid,
+            }
+        store = Store(bot)
+        await sleep(0.1)  # Let Store's RCON check finish
+    # Driven by hand below instead of on their timers
+    for loop in (
+        integration.nickname_sync,
+        integration.compact_profile_links,
+        integration.update_server_status,
+        integration.ftp_keepalive,
+    ):
+        loop.cancel()
+
+    print(
+        f"fake server: {args.players} players, {args.latency * 1000:.1f} ms latency, "
+        f"{args.failure_rate:.1%} failure rate"
+    )
+    member_list = list(members.values())
+
+    async def relay_chat(message: FakeMessage) -> bool:
+        await integration.message_ingame_channel(message)
+        return "❌" not in message.reactions  # Added when the relay fails
+
+    def chat_calls(count: int) -> List:
+        return [
+            (
+                relay_chat,
+                FakeMessage(
+                    member_list[index % args.chatters], ingame_channel, f"hello {index}"
+                ),
+            )
+            for index in range(count)
+        ]
+
+    await run_concurrently(
+        "chat relay (cold profiles)", chat_calls(args.chatters), args.concurrency
+    )
+    await run_concurrently(
+        "chat relay (warm profiles)", chat_calls(args.messages), args.concurrency
+    )
+
+    nickname_sync = integration.nickname_sync.coro
+    await run_concurrently(
+        "nickname_sync (full)", [(nickname_sync, integration)], concurrency=1
+    )
+    server.touch_players(max(args.players // 20, 1))
+    await run_concurrently(
+        "nickname_sync (5% changed)", [(nickname_sync, integration)], concurrency=1
+    )
+
+    purchases = [
+        {
+            "user_name": f"Player{index % args.players}",
+            "item": {
+                "friendly_name": "Boost Key",
+                "commands": [
+                    "crazycrate give physical Boost 1 {username}",
+                    "eco give {username} 100",
+                ],
+            },
+        }
+        for index in range(args.purchases)
+    ]
+    await run_concurrently(
+        "give_ingame_items",
+        [
+            (store.give_ingame_items, purchase, f"benchmark-{index}", set())
+            for index, purchase in enumerate(purchases)
+        ],
+        args.concurrency,
+    )
+
+    print(
+        f"server saw {server.rcon_commands_received} RCON commands, "
+        f"{server.ftp_files_sent} FTP downloads; "
+        f"{sum(member.edits for member in member_list)} nicknames edited"
+    )
+    print(f"RCON dispatcher: {integration.rcon_dispatcher.stats()}")
+
+    with redirect_stdout(StringIO()):
+        integration.cog_unload()
+        store.cog_unload()
+        await sleep(0.1)
+    server.close()
+
+
+def main():
+    parser = ArgumentParser(description="Load scenario for the Minecraft integration.")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--chatters", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--purchases", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request"
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # The cogs read and write 'data/' relative to the working directory
+    with TemporaryDirectory() as temp_dir:
+        chdir(temp_dir)
+        run(scenario(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmarks the tellraw nickname formatter against the previous character-by-character
+implementation, checking both give the same components. Run from 'src' with:
+poetry run python -m benchmarks.tellraw_formatter
+"""
+import json
+from random import Random
+from time import perf_counter
+from typing import Any, Dict, List
+
+from tellraw import format_nickname, nickname_json, nickname_json_cache
+
+ITERATIONS = 20000
+
+
+def reference_tellraw_formatter(message: str) -> List[Dict[str, Any]]:
+    """
+    The original MinecraftIntegration.tellraw_formatter, kept as the correctness reference.
+    """
+    message_obj = []
+    bold = False
+    strikethrough = False
+    underline = False
+    italic = False
+    colors = {
+        "0": "black",
+        "1": "dark_blue",
+        "2": "dark_green",
+        "3": "dark_aqua",
+        "4": "dark_red",
+        "5": "dark_purple",
+        "6": "gold",
+        "7": "gray",
+        "8": "dark_gray",
+        "9": "blue",
+        "a": "green",
+        "b": "aqua",
+        "c": "red",
+        "d": "light_purple",
+        "e": "yellow",
+        "f": "white",
+    }
+    formats = {
+        "l": "bold",
+        "m": "strikethrough",
+        "n": "underline",
+        "o": "italic",
+        "r": "reset",
+    }
+    tmp_text = ""
+    tmp_message_object: Dict[str, Any] = {}
+    primed = False
+
+    def get_format(bold, strikethrough, underline, italic):
+        obj = {}
+        if bold:
+            obj["bold"] = True
+        if strikethrough:
+            obj["strikethrough"] = True
+        if underline:
+            obj["underline"] = True
+        if italic:
+            obj["italic"] = True
+        return obj
+
+    for character in message:
+        if character == "§":
+            primed = True
+            continue
+        elif primed:
+            primed = False
+            if character in colors:
+                if len(tmp_text) > 0:
+                    tmp_message_object["text"] = tmp_text
+                    message_obj.append(tmp_message_object)
+                tmp_text = ""
+                tmp_message_object = get_format(bold, strikethrough, underline, italic)
+                tmp_message_object["color"] = colors[character]
+                continue
+            elif character not in formats:
+                continue
+
+            if len(tmp_text) > 0:
+                tmp_message_object["text"] = tmp_text
+                message_obj.append(tmp_message_object)
+            tmp_text = ""
+
+            msg_format = formats[character]
+            if msg_format == "bold":
+                bold = True
+            elif msg_format == "strikethrough":
+                strikethrough = True
+            elif msg_format == "underline":
+                underline = True
+            elif msg_format == "italic":
+                italic = True
+            elif msg_format == "reset":
+                bold = False
+                strikethrough = False
+                underline = False
+                italic = False
+                if "color" in tmp_message_object:
+                    del tmp_message_object["color"]
+            tmp_message_object = get_format(bold, strikethrough, underline, italic)
+        else:
+            tmp_text += character
+
+    if len(tmp_text) > 0:
+        tmp_message_object["text"] = tmp_text
+        message_obj.append(tmp_message_object)
+
+    return message_obj
+
+
+def check_equivalence(rng: Random, count: int = 50000):
+    alphabet = "ab§§0cflmnorRA\n "
+    for _ in range(count):
+        name = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        expected = reference_tellraw_formatter(name)
+        actual = format_nickname(name)
+        if json.dumps(actual) != json.dumps(expected):
+            raise AssertionError(f"Output differs for {name!r}: {actual} != {expected}")
+
+
+def time_per_call(function, names: List[str]) -> float:
+    start = perf_counter()
+    for index in range(ITERATIONS):
+        function(names[index % len(names)])
+    return (perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    rng = Random(1337)  # nosec
+    check_equivalence(rng)
+
+    names = [
+        "§6§lKing§r§7Arthur",
+        "§c§oRed§9Blue§a§nGreen",
+        "§bSky§lWalker§r_99",
+        "§4§l§m§n§oEverything§rNothing",
+    ]
+    reference_time = time_per_call(reference_tellraw_formatter, names)
+    tokenizer_time = time_per_call(format_nickname, names)
+    reference_json_time = time_per_call(
+        lambda name: json.dumps(reference_tellraw_formatter(name)), names
+    )
+    nickname_json_cache.clear()
+    memoized_time = time_per_call(nickname_json, names)
+
+    print(f"reference formatter:              {reference_time:.2f} us/name")
+    print(f"split tokenizer:                  {tokenizer_time:.2f} us/name")
+    print(f"reference formatter + json.dumps: {reference_json_time:.2f} us/name")
+    print(f"memoized nickname_json:           {memoized_time:.2f} us/name")
+    print(f"memo cache: {nickname_json_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
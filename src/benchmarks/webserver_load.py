@@ -0,0 +1,348 @@
+"""
+Load benchmark for webserver:app. Drives the donation and status endpoints in-process (ASGI
+calls, no network) and over a local socket against real server processes with 1..N workers,
+with and without the bot concurrently recording donations, and reports throughput, p50/p99
+latency and per-worker RSS. Run from 'src' with:
+poetry run python -m benchmarks.webserver_load --workers 1,2,4
+"""
+import sys
+from argparse import ArgumentParser
+from asyncio import gather, open_connection, run, sleep
+from importlib.util import find_spec
+from multiprocessing import Event, Process, Queue
+from os import chdir, environ
+from pathlib import Path
+from socket import socket
+from subprocess import DEVNULL, Popen  # nosec
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from typing import Dict, List, Optional, Tuple
+
+from donation_ledger import DONATIONS_DATABASE_PATH, DonationLedger
+from status_snapshot import STATUS_SNAPSHOT_PATH, StatusSnapshotWriter
+
+SRC_PATH = Path(__file__).resolve().parent.parent
+DONATIONS_TOKEN = "benchmark_token"  # nosec
+DONATIONS_PATH = f"/donations/{DONATIONS_TOKEN}"
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+def report(name: str, latencies: List[float], elapsed: float, extra: str = ""):
+    if not latencies:
+        print(f"{name:<40} no successful requests")
+        return
+    print(
+        f"{name:<40} {len(latencies):>7} req  {len(latencies) / elapsed:>9.1f} req/s  "
+        f"p50 {percentile(latencies, 0.50):>7.2f} ms  p99 {percentile(latencies, 0.99):>7.2f} ms"
+        f"{extra}"
+    )
+
+
+def bot_writer(stop, rate: float):
+    """
+    Stands in for the bot: records donations and publishes the status snapshot at 'rate'
+    writes per second, in its own process like the real bot.
+    """
+    ledger = DonationLedger(Path.cwd() / DONATIONS_DATABASE_PATH)
+    snapshot = StatusSnapshotWriter(Path.cwd() / STATUS_SNAPSHOT_PATH)
+    count = 0
+    while not stop.is_set():
+        count += 1
+        ledger.record(f"benchmark-{time()}-{count}", 1.0, "USD")
+        snapshot.update_donation_total(ledger.monthly_total())
+        snapshot.update_server_status(
+            True, count % 100, 100, f"{count % 100}/100 players"
+        )
+        stop.wait(1 / rate)
+
+
+def seed_data():
+    ledger = DonationLedger(Path.cwd() / DONATIONS_DATABASE_PATH)
+    for index in range(100):
+        ledger.record(f"seed-{index}", 2.5, "USD")
+    snapshot = StatusSnapshotWriter(Path.cwd() / STATUS_SNAPSHOT_PATH)
+    snapshot.update_donation_total(ledger.monthly_total())
+    snapshot.update_server_status(True, 12, 100, "12/100 players")
+    snapshot.update_linked_players(1000)
+    ledger.close()
+    snapshot.close()
+
+
+# In-process
+
+
+async def asgi_get(app, path: str, headers: Dict[str, str]) -> int:
+    response: Dict[str, int] = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+    await app(scope, receive, send)
+    return response["status"]
+
+
+async def in_process(requests: int, concurrency: int):
+    import webserver  # Imported here, it opens the data files relative to the working dir
+
+    async def run_scenario(
+        name: str, path: str, cold: bool = False, etag: bool = False
+    ):
+        headers = {}
+        if etag:
+            _, headers["If-None-Match"] = await webserver.donation_progress.get()
+        latencies: List[float] = []
+
+        async def one_request():
+            if cold:  # Forget the cached percentage, so every request reads the ledger
+                webserver.donation_progress.signature = None
+                webserver.donation_progress.next_check_time = 0.0
+            start = perf_counter()
+            await asgi_get(webserver.app, path, headers)
+            latencies.append(perf_counter() - start)
+
+        # One at a time when cold, concurrent requests would share a single refresh
+        batch_size = 1 if cold else concurrency
+        start = perf_counter()
+        for index in range(0, requests, batch_size):
+            await gather(
+                *(one_request() for _ in range(min(batch_size, requests - index)))
+            )
+        report(f"in-process {name}", latencies, perf_counter() - start)
+
+    await run_scenario("donations (cold cache)", DONATIONS_PATH, cold=True)
+    await run_scenario("donations (warm cache)", DONATIONS_PATH)
+    await run_scenario("donations (304, warm cache)", DONATIONS_PATH, etag=True)
+    await run_scenario("status", "/status")
+
+
+# Over a local socket
+
+
+async def http_client(
+    port: int, path: str, connections: int, duration: float, etag: Optional[str]
+) -> Tuple[List[float], int]:
+    request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+    if etag:
+        request += f"If-None-Match: {etag}\r\n"
+    encoded_request = (request + "\r\n").encode()
+    latencies: List[float] = []
+    errors = 0
+    end_time = perf_counter() + duration
+
+    async def connection():
+        nonlocal errors
+        reader, writer = await open_connection("127.0.0.1", port)
+        while perf_counter() < end_time:
+            start = perf_counter()
+            writer.write(encoded_request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            if status in (200, 304):
+                latencies.append(perf_counter() - start)
+            else:
+                errors += 1
+        writer.close()
+
+    await gather(*(connection() for _ in range(connections)))
+    return latencies, errors
+
+
+def client_process(queue, port, path, connections, duration, etag):
+    queue.put(run(http_client(port, path, connections, duration, etag)))
+
+
+def free_port() -> int:
+    with socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def is_supervised(workers: int) -> bool:
+    """
+    Whether the server runs its workers under a supervisor process, which isn't a worker.
+    """
+    return find_spec("gunicorn") is not None or workers > 1
+
+
+def start_server(workers: int, port: int) -> Popen:
+    if find_spec("gunicorn") is not None:
+        # Same worker setup as start_webserver.sh
+        command = ["-m", "gunicorn", "webserver:app", "-w", str(workers)]
+        command += ["-k", "uvicorn.workers.UvicornWorker", "-b", f"127.0.0.1:{port}"]
+    else:
+        command = ["-m", "uvicorn", "webserver:app", "--workers", str(workers)]
+        command += ["--port", str(port), "--log-level", "warning"]
+    environment = dict(environ, PYTHONPATH=str(SRC_PATH))
+    return Popen(  # nosec
+        [sys.executable, *command], env=environment, stdout=DEVNULL, stderr=DEVNULL
+    )
+
+
+def wait_for_workers(server: Popen, workers: int, port: int):
+    async def probe():
+        reader, writer = await open_connection("127.0.0.1", port)
+        writer.write(b"GET /status HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+
+    for _ in range(300):
+        try:
+            if len(worker_pids(server.pid, workers)) >= workers:
+                run(probe())
+                return
+        except OSError:
+            pass
+        run(sleep(0.1))
+    raise TimeoutError("Webserver didn't start")
+
+
+def worker_pids(pid: int, workers: int) -> List[int]:
+    """
+    The server's worker processes (Linux only): its children when it runs a supervisor, minus
+    multiprocessing's resource tracker, otherwise the server process itself.
+    """
+    if not is_supervised(workers):
+        return [pid]
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return []
+    worker_ids = []
+    for child in children:
+        try:
+            command_line = Path(f"/proc/{child}/cmdline").read_bytes()
+        except OSError:
+            continue
+        if b"resource_tracker" not in command_line:
+            worker_ids.append(int(child))
+    return worker_ids
+
+
+def rss_megabytes(pid: int) -> float:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def current_etag() -> str:
+    ledger = DonationLedger(Path.cwd() / DONATIONS_DATABASE_PATH, read_only=True)
+    percentage = round(ledger.monthly_total() / int(environ["DONATIONS_GOAL"]) * 100)
+    ledger.close()
+    return f'"{percentage}"'
+
+
+def over_socket(args, workers: int):
+    port = free_port()
+    server = start_server(workers, port)
+    try:
+        wait_for_workers(server, workers, port)
+
+        def run_scenario(name: str, path: str, etag: Optional[str] = None):
+            queue: Queue = Queue()
+            clients = [
+                Process(
+                    target=client_process,
+                    args=(queue, port, path, args.connections, args.duration, etag),
+                )
+                for _ in range(args.clients)
+            ]
+            start = perf_counter()
+            for client in clients:
+                client.start()
+            results = [queue.get() for _ in clients]
+            elapsed = perf_counter() - start
+            for client in clients:
+                client.join()
+
+            latencies = [latency for result in results for latency in result[0]]
+            errors = sum(result[1] for result in results)
+            rss = ", ".join(
+                f"{rss_megabytes(pid):.0f}" for pid in worker_pids(server.pid, workers)
+            )
+            report(
+                f"{workers} worker(s) {name}",
+                latencies,
+                elapsed,
+                f"  {errors} errors  RSS MB [{rss}]",
+            )
+
+        run_scenario("donations", DONATIONS_PATH)
+        run_scenario("donations (304)", DONATIONS_PATH, etag=current_etag())
+        run_scenario("status", "/status")
+
+        stop = Event()
+        writer = Process(target=bot_writer, args=(stop, args.write_rate))
+        writer.start()
+        run_scenario(f"donations + {args.write_rate:g} writes/s", DONATIONS_PATH)
+        run_scenario(f"status + {args.write_rate:g} writes/s", "/status")
+        stop.set()
+        writer.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = ArgumentParser(description="Load benchmark for the FastAPI webserver.")
+    parser.add_argument("--requests", type=int, default=20000, help="In-process")
+    parser.add_argument("--concurrency", type=int, default=100, help="In-process")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to compare")
+    parser.add_argument(
+        "--clients", type=int, default=2, help="Load generator processes"
+    )
+    parser.add_argument(
+        "--connections", type=int, default=32, help="Per client process"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="Seconds per scenario"
+    )
+    parser.add_argument("--write-rate", type=float, default=20.0, help="Bot writes/s")
+    args = parser.parse_args()
+
+    # The webserver reads 'data/' relative to the working directory, like in production
+    with TemporaryDirectory() as temp_dir:
+        chdir(temp_dir)
+        environ["DONATIONS_TOKEN"] = DONATIONS_TOKEN
+        environ["DONATIONS_GOAL"] = "100"
+        seed_data()
+
+        run(in_process(args.requests, args.concurrency))
+        for workers in (int(count) for count in args.workers.split(",")):
+            over_socket(args, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from asyncio import Task, create_task, sleep
+from traceback import format_exc
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from utils import do_log, log_error
+
+
+class DebouncedWebhook:
+    """
+    Triggers the site rebuild webhook without blocking the event loop. Every trigger within
+    'window' seconds of the first is coalesced into a single POST, sent once the window has
+    passed. Triggers that arrive while a POST is being sent start the next window. The HTTP
+    session (and its keep-alive connection) is reused between POSTs.
+    """
+
+    def __init__(self, url: str, window: float = 60.0, timeout: float = 10.0):
+        self.url = url
+        self.window = window
+        self.timeout = ClientTimeout(total=timeout)
+        self.session: Optional[ClientSession] = None
+        self.pending: Optional[Task] = None
+        self.coalesced = 0
+        self.sent = 0
+
+    def trigger(self):
+        if not self.url:
+            return
+        if self.pending is not None and not self.pending.done():
+            self.coalesced += 1
+            return
+        self.pending = create_task(self._send_after_window())
+
+    async def _send_after_window(self):
+        await sleep(self.window)
+        # New triggers from here on need a rebuild that includes them, so start a new window
+        self.pending = None
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(
+                connector=TCPConnector(limit=1), timeout=self.timeout
+            )
+        try:
+            async with self.session.post(self.url) as response:
+                response.raise_for_status()
+            self.sent += 1
+            do_log(f"[Webhook] Triggered site rebuild ({self.coalesced} coalesced)")
+            self.coalesced = 0
+        except Exception:
+            log_error(f"[Webhook] Failed to trigger site rebuild\n{format_exc()}")
+
+    async def close(self):
+        if self.pending is not None:
+            self.pending.cancel()
+        if self.session is not None:
+            await self.session.close()
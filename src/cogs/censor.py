@@ -1,39 +1,104 @@
-import re
-from typing import List
+from asyncio import get_running_loop
+from time import perf_counter
+from traceback import format_exc
+from typing import Any, Dict, Set, Tuple
 
 import discord
 from discord.ext import commands
 
-from utils import BotClass
+from utils import BotClass, LRUCache, do_log, json_load_eval, log_error
+from word_filter import WordFilter
 
 
 class Censor(commands.Cog):
     def __init__(self, bot: BotClass):
+        self.bot = bot
         cfg = bot.CFG.get("censor", {})
+        self.apply_config(cfg, WordFilter(cfg))
+
+    def apply_config(self, cfg: Dict[str, Any], word_filter: WordFilter):
+        """
+        Derives everything from the 'censor' config block, on startup and on reload.
+        """
         self.channels_without_censoring = cfg.get("channels_without_censoring", [])
-        self.words_startswith = cfg.get("words_startswith", [])
-        self.words_independent = cfg.get("words_independent", [])
-        self.words_inside_words = cfg.get("words_inside_words", [])
         self.highest_censored_role_name = cfg.get("highest_censored_role_name", "")
         self.bots_no_warn_channel_names = cfg.get("bots_no_warn_channel_names", [])
-        self.letter_replacements = cfg.get("letter_replacements", {})
+        # Verdicts from the old word lists are stale, so always start a fresh cache
+        self.verdict_cache = LRUCache(cfg.get("verdict_cache_size", 1024))
+        self.word_filter = word_filter
 
-        self.highest_censored_role = bot.roles.get(
+        self.highest_censored_role = self.bot.roles.get(
             self.highest_censored_role_name, None
         )
         self.bots_no_warn_channel_ids = [
-            bot.CFG["discord_channel_ids"].get(channel_name, -1)
+            self.bot.CFG["discord_channel_ids"].get(channel_name, -1)
             for channel_name in self.bots_no_warn_channel_names
         ]
-        self.words_regex = re.compile(r"[^\sa-zA-Z0-9]+", re.UNICODE)
-        self.uncensored_channels: List[int] = []
-        self.bot = bot
-
+        self.uncensored_channels: Set[int] = set()
         for channel in self.bot.guild.text_channels:
-            do_not_censor = channel.id in self.channels_without_censoring
+            self.update_uncensored_channel(channel)
+
+    def load_word_filter_from_file(self) -> Tuple[Dict[str, Any], WordFilter]:
+        """
+        Re-reads only the 'censor' block of the config file and compiles a new filter from it.
+        Blocking, meant to be run in an executor.
+        """
+        with open(self.bot.config_path, "r", encoding="utf-8") as config_file:
+            cfg = json_load_eval(config_file).get("censor", {})
+        return cfg, WordFilter(cfg)
+
+    @commands.command(name="reloadcensor")
+    async def reload_censor(self, ctx: commands.Context):
+        if ctx.author.id != self.bot.CFG["discord_bot_owner_id"]:
+            return
+
+        start_time = perf_counter()
+        try:
+            cfg, word_filter = await get_running_loop().run_in_executor(
+                None, self.load_word_filter_from_file
+            )
+        except Exception:
+            log_error(f"[Censor] Failed to reload censor config\n{format_exc()}")
+            await ctx.send("Failed to reload censor config, check bot error logs")
+            return
+        self.bot.CFG["censor"] = cfg
+        self.apply_config(cfg, word_filter)
+
+        rebuild_time = perf_counter() - start_time
+        do_log(
+            f"[Censor] Reloaded {word_filter.term_count} words in {rebuild_time:.3f}s"
+        )
+        await ctx.send(
+            f"Reloaded censor config ({word_filter.term_count} words) in {rebuild_time:.3f}s"
+        )
 
-            if do_not_censor or self.is_mod_chat(channel):
-                self.uncensored_channels.append(channel.id)
+    def update_uncensored_channel(self, channel: discord.abc.GuildChannel):
+        """
+        Re-evaluates whether a single channel is exempt from censoring.
+        """
+        if not isinstance(channel, discord.TextChannel):
+            return
+        do_not_censor = channel.id in self.channels_without_censoring
+        if do_not_censor or self.is_mod_chat(channel):
+            self.uncensored_channels.add(channel.id)
+        else:
+            self.uncensored_channels.discard(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if channel.guild.id == self.bot.guild.id:
+            self.update_uncensored_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        if after.guild.id == self.bot.guild.id:
+            self.update_uncensored_channel(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.uncensored_channels.discard(channel.id)
 
     def is_mod_chat(self, channel: discord.TextChannel) -> bool:
         not_everyone_can_see = False
@@ -60,33 +125,24 @@ class Censor(commands.Cog):
         return False
 
     async def should_censor_message(self, text):
-        censor = False
-        text = text.lower()
-        # Replace any attempts at bypassing with different characters
-        for bypass_letter, original_letter in self.letter_replacements.items():
-            text = text.replace(str(bypass_letter), str(original_letter))
-        text = self.words_regex.sub("", text)  # Strip non-alpha-num
-        split_message = text.split(" ")
-
-        for word in split_message:
-            for censored_word in self.words_startswith:
-                if word.startswith(censored_word):
-                    censor = True
-                    break
-            # Censored words unlikely to be part of other words
-            for whole_censored_word in self.words_inside_words:
-                if whole_censored_word in word:
-                    censor = True
-                    break
-            if censor:
-                break
-
-        # Split by spaces
-        if not censor and any(word in split_message for word in self.words_independent):
-            censor = True
-
+        # Fold case, bypass characters and lookalikes, and strip non-alpha-num in one pass
+        word_filter = self.word_filter  # Stays consistent even if a reload swaps it
+        text = word_filter.normalize(text)
+
+        # Spam and raids repeat the same message body, so reuse earlier verdicts
+        censor = self.verdict_cache.get(text)
+        if censor is None:
+            # All three word lists are checked in a single pass, see WordMatcher
+            censor = word_filter.matches(text)
+            self.verdict_cache.put(text, censor)
         return censor
 
+    @commands.command(name="censorstats")
+    async def censor_stats(self, ctx: commands.Context):
+        if ctx.author.id != self.bot.CFG["discord_bot_owner_id"]:
+            return
+        await ctx.send(f"Censor verdict cache: {self.verdict_cache.stats()}")
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.channel.id in self.uncensored_channels:
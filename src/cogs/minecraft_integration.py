@@ -1,19 +1,38 @@
 import json
-from ftplib import FTP  # nosec
+from asyncio import Semaphore, Task
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import create_task, gather, get_running_loop, shield
 from ftplib import error_perm  # nosec
 from os import getenv
 from pathlib import Path
-from re import sub as re_sub
+from time import perf_counter
 from traceback import format_exc
-from typing import Any, Dict, List
+from typing import Any, Dict, Optional
 
 import discord
 from discord.ext import commands, tasks
-from mctools import PINGClient, RCONClient
 from parse import compile as parser_compile
-from yaml import safe_load as yaml_safe_load
 
-from utils import BotClass, do_log, json_load_eval, log_error
+from essentials_mirror import (
+    ESSENTIALS_USERDATA_PATH,
+    EssentialsMirror,
+    parse_essentials_fields,
+)
+from ftp_pool import FTPPool, retrieve_lines
+from profile_links import ProfileLink, ProfileLinks, ProfileLinksJournal
+from rcon import AsyncRCONClient, RCONDispatcher
+from server_ping import ServerStatusPoller
+from tellraw import join_json_arrays, nickname_json, strip_formatting
+from utils import BotClass, TTLCache, do_log, log_error
+
+DISCORD_PREFIX_JSON = json.dumps(
+    [
+        {"text": "[", "color": "white"},
+        {"text": "Discord", "color": "blue"},
+        {"text": "] ", "color": "white"},
+    ]
+)
+NAME_SEPARATOR_JSON = json.dumps([{"text": " >> ", "bold": True, "color": "gray"}])
 
 
 class MinecraftIntegration(commands.Cog):
@@ -39,8 +58,12 @@ class MinecraftIntegration(commands.Cog):
         await self.message_discordsrv_dm(message)
 
     def init_discordsrv(self) -> bool:
-        self.discord_to_minecraft = {}
+        self.discord_to_minecraft = ProfileLinks()
         self.nickname_sync_skip = self.bot.CFG.get("nickname_sync_skip_discord_ids", [])
+        self.nickname_sync_concurrency = self.bot.CFG.get(
+            "nickname_sync_concurrency", 16
+        )
+        self.nickname_sync_signatures: Dict[int, str] = {}
 
         data_file_name = "profile_links.json"
         data_folder_path = Path.cwd() / "data"
@@ -52,19 +75,14 @@ class MinecraftIntegration(commands.Cog):
             return False
         self.message_parser = parser_compile(discordsrv_message)
 
-        # Load the datafile
-        try:
-            with open(self.data_file_path, "r") as json_file:
-                self.discord_to_minecraft = json_load_eval(json_file)
-            print(
-                f"[Loaded Minecraft integration datafile with {len(self.discord_to_minecraft)} users]"
-            )
-        except FileNotFoundError:
-            Path(data_folder_path).mkdir(exist_ok=True)
-            with open(self.data_file_path, "w") as json_file:
-                json.dump(self.discord_to_minecraft, json_file, indent=4)
-
-        self.nickname_sync.start()
+        # Load the snapshot and replay any links journaled since it was written
+        self.profile_links_journal = ProfileLinksJournal(self.data_file_path)
+        self.discord_to_minecraft = self.profile_links_journal.load()
+        print(
+            f"[Loaded Minecraft integration datafile with {len(self.discord_to_minecraft)} users]"
+        )
+        self.bot.status_snapshot.update_linked_players(len(self.discord_to_minecraft))
+        self.compact_profile_links.start()
         return True
 
     async def message_discordsrv_dm(self, message: discord.Message):
@@ -79,22 +97,19 @@ class MinecraftIntegration(commands.Cog):
         discord_user = message.channel.recipient
         discord_name = f"{discord_user.name}#{discord_user.discriminator}"
 
-        existing = False
-        for user in self.discord_to_minecraft.values():
-            if minecraft_uuid == user["minecraft_uuid"]:
-                existing = True
-                break
+        existing = (
+            self.discord_to_minecraft.discord_id_for_uuid(minecraft_uuid) is not None
+        )
 
-        self.discord_to_minecraft[discord_user.id] = {
-            "minecraft_name": minecraft_name,
-            "minecraft_uuid": minecraft_uuid,
-            "discord_name": discord_name,  # Not kept up-to-date, just human-readable indicator
-        }
-        with open(self.data_file_path, "w") as json_file:
-            json.dump(self.discord_to_minecraft, json_file, indent=4)
+        profile = ProfileLink(minecraft_name, minecraft_uuid, discord_name)
+        self.discord_to_minecraft[discord_user.id] = profile
+        self.profile_links_journal.append_link(discord_user.id, profile)
+        self.bot.status_snapshot.update_linked_players(len(self.discord_to_minecraft))
 
         if not existing:
-            self.rcon_command(f"crazycrate give physical Boost 1 {minecraft_name}")
+            await self.rcon_command(
+                f"crazycrate give physical Boost 1 {minecraft_name}"
+            )
             await discord_user.send(
                 "For verifying, you have been given 1 Boost key!\n"
                 "If you do not see it, please run the ``/keys`` command to see if you have a virtual key.\n"
@@ -108,15 +123,53 @@ class MinecraftIntegration(commands.Cog):
         except Exception:
             log_error(format_exc())
 
+    @tasks.loop(seconds=600)
+    async def compact_profile_links(self):
+        if self.profile_links_journal.journal_entries == 0:
+            return
+        snapshot = self.profile_links_journal.start_compaction(
+            self.discord_to_minecraft
+        )
+        try:
+            await get_running_loop().run_in_executor(
+                None, self.profile_links_journal.finish_compaction, snapshot
+            )
+        except Exception:
+            log_error(f"[Compact Profile Links]\n{format_exc()}")
+
     def init_ingame_chat(self) -> bool:
         self.censor_function = self.bot.client.get_cog("Censor").should_censor_message
 
+        self.essentials_cache = TTLCache(
+            self.bot.CFG.get("essentials_profile_cache_size", 4096)
+        )
+        self.essentials_cache_seconds = self.bot.CFG.get(
+            "essentials_profile_cache_seconds", 300
+        )
+        self.essentials_missing_cache_seconds = self.bot.CFG.get(
+            "essentials_profile_missing_cache_seconds", 60
+        )
+        self.essentials_fetches: Dict[str, Task] = {}
+
         self.ftp_host = getenv("MINECRAFT_FTP_HOST", "")
         self.ftp_username = getenv("MINECRAFT_FTP_USERNAME", "")
         self.ftp_password = getenv("MINECRAFT_FTP_PASSWORD", "")
         if "" in [self.ftp_host, self.ftp_username, self.ftp_password]:
             print("[One or more FTP .env variables are empty]")
             return False
+        self.ftp_pool = FTPPool(
+            self.ftp_host,
+            self.ftp_username,
+            self.ftp_password,
+            port=int(getenv("MINECRAFT_FTP_PORT", "21")),
+            size=self.bot.CFG.get("ftp_pool_size", 2),
+            timeout=self.bot.CFG.get("ftp_timeout_seconds", 10),
+        )
+        self.ftp_keepalive.start()
+        self.essentials_mirror = EssentialsMirror(
+            self.ftp_pool, Path.cwd() / "data" / "essentials_userdata"
+        )
+        self.nickname_sync.start()  # Reads nicknames from the mirror
 
         self.rcon_host = getenv("MINECRAFT_RCON_HOST", "")
         self.rcon_password = getenv("MINECRAFT_RCON_PASSWORD", "")
@@ -124,6 +177,14 @@ class MinecraftIntegration(commands.Cog):
         if "" in [self.rcon_host, self.rcon_password, self.rcon_port]:
             print("[One or more RCON .env variables are empty]")
             return False
+        self.rcon = AsyncRCONClient(
+            self.rcon_host, int(self.rcon_port), self.rcon_password
+        )
+        self.rcon_dispatcher = RCONDispatcher(
+            self.rcon,
+            batch_window=self.bot.CFG.get("rcon_batch_window_seconds", 0.05),
+            max_queue_size=self.bot.CFG.get("rcon_max_queue_size", 256),
+        )
 
         ingame_channel_name = self.bot.CFG.get("ingame_chat_channel_name", None)
         if ingame_channel_name is None:
@@ -137,36 +198,74 @@ class MinecraftIntegration(commands.Cog):
 
         return True
 
-    def rcon_command(self, cmd=None, cmds=None, only_auth=False):
-        rcon = RCONClient(self.rcon_host, port=self.rcon_port)
+    async def rcon_command(
+        self,
+        cmd=None,
+        cmds=None,
+        only_auth=False,
+        destination="default",
+        isolated=False,
+    ) -> bool:
+        """
+        Runs commands through the dispatcher, returns False if any of them failed. 'isolated'
+        commands are sent as their own batch, one at a time, instead of alongside chat.
+        """
         try:
-            rcon.login(self.rcon_password)
-            if not rcon.is_authenticated():
-                raise ConnectionRefusedError  # Raises this anyway in severe failure
-        except ConnectionRefusedError:
-            print("[RCON failed to authenticate]")
-            try:
-                rcon.stop()
-            except Exception:  # Not sure what exception would happen here
-                return False
+            await self.rcon.connect()
+        except (OSError, AsyncTimeoutError):  # RCONError is a ConnectionError
+            print(f"[RCON failed to authenticate]\n{format_exc()}")
             return False
-        if not only_auth:
-            commands_to_execute = []
-            if cmds is None and cmd is not None:
-                commands_to_execute.append(cmd)
-            else:
-                commands_to_execute = cmds[:]
-
-            for cmd in commands_to_execute:
-                response = rcon.command(cmd, length_check=False)
-                print(response)
-
-            try:
-                rcon.stop()
-            except Exception:  # Not sure what exception would happen here
+        if only_auth:
+            return True
+
+        commands_to_execute = []
+        if cmds is None and cmd is not None:
+            commands_to_execute.append(cmd)
+        else:
+            commands_to_execute = cmds[:]
+
+        if isolated:
+            responses = await self.rcon_dispatcher.put_isolated(commands_to_execute)
+        else:
+            # Queued in order, then sent along with anything else issued in the batch window
+            responses = [
+                await self.rcon_dispatcher.put(cmd, destination)
+                for cmd in commands_to_execute
+            ]
+        # Every response is awaited, so one failure doesn't leave the others unretrieved
+        results = await gather(*responses, return_exceptions=True)
+        for result in results:
+            if isinstance(result, (OSError, AsyncTimeoutError)):
+                log_error(f"[RCON] Failed to run command\n{result!r}")
                 return False
+            if isinstance(result, BaseException):
+                raise result
+            print(result)
         return True
 
+    @commands.command(name="rconstats")
+    async def rcon_stats(self, ctx: commands.Context):
+        if ctx.author.id != self.bot.CFG["discord_bot_owner_id"]:
+            return
+        await ctx.send(f"RCON dispatcher: {self.rcon_dispatcher.stats()}")
+
+    @tasks.loop(seconds=60)
+    async def ftp_keepalive(self):
+        try:
+            await self.ftp_pool.keepalive()
+        except Exception:
+            log_error(f"[FTP Keepalive]\n{format_exc()}")
+
+    def cog_unload(self):
+        self.nickname_sync.cancel()
+        self.update_server_status.cancel()
+        self.compact_profile_links.cancel()
+        self.profile_links_journal.close()
+        create_task(self.rcon_dispatcher.close())
+        create_task(self.rcon.close())
+        self.ftp_keepalive.cancel()
+        self.ftp_pool.close()
+
     async def message_ingame_channel(self, message: discord.Message):
         if message.channel.id != self.ingame_channel.id or message.author.bot:
             return
@@ -198,37 +297,26 @@ class MinecraftIntegration(commands.Cog):
 
                 if essentials_profile["success"] is False:
                     raise Exception("Failure in 'get_essentials_profile' function")
-                elif not essentials_profile["data"]:  # Empty/Falsey
+                elif not essentials_profile["found"]:
                     failed = True
                     failed_msg = f"Could not find Essentials profile for Minecraft ID `{user_uuid}` ({user_name})!"
                 else:
                     display_name = user_name
-                    clean_display_name = user_name
                     if "nickname" in essentials_profile["data"]:
                         display_name = essentials_profile["data"]["nickname"]
-                        clean_display_name = re_sub(r"(§[a-zA-Z0-9])", "", display_name)
-                    embed.description = (
-                        f"[Discord] {clean_display_name}: {clean_everyone_content}"
-                    )
+                    embed.description = f"[Discord] {strip_formatting(display_name)}: {clean_everyone_content}"
 
-                    raw_text_obj: List[Dict[str, Any]] = [
-                        {"text": "[", "color": "white"},
-                        {"text": "Discord", "color": "blue"},
-                        {"text": "] ", "color": "white"},
-                    ]
-                    if clean_display_name == display_name:
-                        raw_text_obj.append({"text": display_name, "color": "gray"})
-                    else:
-                        formatted_name = self.tellraw_formatter(display_name)
-                        for obj in formatted_name:
-                            raw_text_obj.append(obj)
-                    raw_text_obj.append({"text": " >> ", "bold": True, "color": "gray"})
-                    raw_text_obj.append(
-                        {"text": message.clean_content, "color": "white"}
+                    message_json = json.dumps(
+                        [{"text": message.clean_content, "color": "white"}]
                     )
-
-                    tellraw_str = json.dumps(raw_text_obj)
-                    self.rcon_command(f"tellraw @a {tellraw_str}")
+                    tellraw_json = join_json_arrays(
+                        DISCORD_PREFIX_JSON,
+                        nickname_json(display_name),  # Memoized per display name
+                        NAME_SEPARATOR_JSON,
+                        message_json,
+                    )
+                    if not await self.rcon_dispatcher.send_chat(tellraw_json):
+                        raise ConnectionError("Failed to send tellraw over RCON")
 
                     await message.channel.send(embed=embed)
                     await message.delete()
@@ -260,138 +348,75 @@ class MinecraftIntegration(commands.Cog):
                 await message.delete()
 
     async def get_essentials_profile(self, uuid) -> Dict[str, Any]:
+        """
+        Returns the fields we use from a player's Essentials userdata file. Profiles (and missing
+        profiles) are cached, and concurrent requests for the same uuid share a single fetch.
+        """
+        cached = self.essentials_cache.get(uuid)
+        if cached is not None:
+            return cached
+
+        fetch = self.essentials_fetches.get(uuid)
+        if fetch is None:
+            fetch = create_task(self.fetch_essentials_profile(uuid))
+            self.essentials_fetches[uuid] = fetch
+            fetch.add_done_callback(lambda _: self.essentials_fetches.pop(uuid, None))
+        return await shield(fetch)
+
+    async def fetch_essentials_profile(self, uuid) -> Dict[str, Any]:
         try:
-            # No control over host, have to use ftp even if insecure
-            with FTP(
-                self.ftp_host, self.ftp_username, self.ftp_password
-            ) as ftp:  # nosec
-                ftp.cwd("/plugins/Essentials/userdata")
-                yml_data_list: List[str] = []
-                try:
-                    ftp.retrlines(f"RETR {uuid}.yml", yml_data_list.append)
-                except error_perm:
-                    return {"success": True, "data": {}}
-                yml_data_str = "\n".join(yml_data_list)
-                return {"success": True, "data": yaml_safe_load(yml_data_str)}
+            yml_data_list = await self.ftp_pool.run(
+                retrieve_lines, f"{ESSENTIALS_USERDATA_PATH}/{uuid}.yml"
+            )
+        except error_perm:
+            missing = {"success": True, "found": False, "data": {}}
+            self.essentials_cache.put(
+                uuid, missing, ttl=self.essentials_missing_cache_seconds
+            )
+            return missing
         except Exception:
             log_error("[GetEssentials Error] " + format_exc())
-            return {"success": False, "data": {}}
-
-    def tellraw_formatter(self, message):
-        message_obj = []
-        bold = False
-        strikethrough = False
-        underline = False
-        italic = False
-        colors = {
-            "0": "black",
-            "1": "dark_blue",
-            "2": "dark_green",
-            "3": "dark_aqua",
-            "4": "dark_red",
-            "5": "dark_purple",
-            "6": "gold",
-            "7": "gray",
-            "8": "dark_gray",
-            "9": "blue",
-            "a": "green",
-            "b": "aqua",
-            "c": "red",
-            "d": "light_purple",
-            "e": "yellow",
-            "f": "white",
-        }
-        formats = {
-            "l": "bold",
-            "m": "strikethrough",
-            "n": "underline",
-            "o": "italic",
-            "r": "reset",
-        }
-        tmp_text = ""
-        tmp_message_object = {}
-        primed = False
-
-        def get_format(bold, strikethrough, underline, italic):
-            obj = {}
-            if bold:
-                obj["bold"] = True
-            if strikethrough:
-                obj["strikethrough"] = True
-            if underline:
-                obj["underline"] = True
-            if italic:
-                obj["italic"] = True
-            return obj
-
-        for character in message:
-            if character == "§":
-                primed = True
-                continue
-            elif primed:
-                primed = False
-                if character in colors:
-                    if len(tmp_text) > 0:
-                        tmp_message_object["text"] = tmp_text
-                        message_obj.append(tmp_message_object)
-                    tmp_text = ""
-                    tmp_message_object = get_format(
-                        bold, strikethrough, underline, italic
-                    )
-                    tmp_message_object["color"] = colors[character]
-                    continue
-                elif character not in formats:
-                    continue
-
-                if len(tmp_text) > 0:
-                    tmp_message_object["text"] = tmp_text
-                    message_obj.append(tmp_message_object)
-                tmp_text = ""
-
-                msg_format = formats[character]
-                if msg_format == "bold":
-                    bold = True
-                elif msg_format == "strikethrough":
-                    strikethrough = True
-                elif msg_format == "underline":
-                    underline = True
-                elif msg_format == "italic":
-                    italic = True
-                elif msg_format == "reset":
-                    bold = False
-                    strikethrough = False
-                    underline = False
-                    italic = False
-                    if "color" in tmp_message_object:
-                        del tmp_message_object["color"]
-                tmp_message_object = get_format(bold, strikethrough, underline, italic)
-            else:
-                tmp_text += character
+            return {"success": False, "found": False, "data": {}}
 
-        if len(tmp_text) > 0:
-            tmp_message_object["text"] = tmp_text
-            message_obj.append(tmp_message_object)
+        try:
+            essentials_data = parse_essentials_fields(yml_data_list)
+        except Exception:
+            log_error(
+                f"[GetEssentials Error] Unreadable profile {uuid}\n{format_exc()}"
+            )
+            return {"success": False, "found": False, "data": {}}
 
-        return message_obj
+        profile = {"success": True, "found": True, "data": essentials_data}
+        self.essentials_cache.put(uuid, profile, ttl=self.essentials_cache_seconds)
+        return profile
 
     def init_server_status(self) -> bool:
         self.server_status = "Offline"
+        self.server_status_poller = ServerStatusPoller(
+            self.rcon_host,
+            port=int(getenv("MINECRAFT_SERVER_PORT", "25565")),
+            history_size=self.bot.CFG.get("server_status_history_size", 360),
+        )
         self.update_server_status.start()
         return True
 
     @tasks.loop(seconds=10)
     async def update_server_status(self):
         try:
-            ping_func = PINGClient(self.rcon_host, proto_num=25565)
-            stats = ping_func.get_stats()
-            ping_func.stop()
-            players_obj = stats.get("players", {"max": "ERR", "online": "ERR"})
-            status = f"{players_obj['online']}/{players_obj['max']} players"
-        except ConnectionRefusedError:
-            status = "Server Offline"
+            sample = await self.server_status_poller.poll()
+            if sample is None:
+                return  # Backing off while the server is offline
+            if sample.online:
+                status = f"{sample.players_online}/{sample.players_max} players"
+            else:
+                status = "Server Offline"
+            # Lets the webserver show the status without pinging the server itself
+            self.bot.status_snapshot.update_server_status(
+                sample.online, sample.players_online, sample.players_max, status
+            )
         except Exception:
             status = "ERROR"
-            do_log(f"[update_server_status] ping_func Exception:\n{format_exc()}")
+            do_log(f"[update_server_status] ping Exception:\n{format_exc()}")
 
         try:
             if status != self.server_status:
@@ -404,11 +429,17 @@ class MinecraftIntegration(commands.Cog):
 
     @tasks.loop(seconds=300)
     async def nickname_sync(self):
+        start_time = perf_counter()
+        try:
+            print(await self.essentials_mirror.sync())
+        except Exception:
+            # Compare against whatever was mirrored last time instead
+            log_error(f"[NameSync] Failed to sync Essentials mirror\n{format_exc()}")
+
         found = 0
-        needed_change = 0
-        changed = 0
-        for discord_id in self.discord_to_minecraft:
-            profile = self.discord_to_minecraft[discord_id]
+        unchanged = 0
+        to_check = []
+        for discord_id, profile in list(self.discord_to_minecraft.items()):
             member = self.bot.guild.get_member(discord_id)
             if member is None:
                 print(f"[NameSync] User not in discord\n{profile}")
@@ -418,33 +449,66 @@ class MinecraftIntegration(commands.Cog):
             if discord_id in self.nickname_sync_skip:
                 continue
 
-            final_name = profile["minecraft_name"]
+            # Userdata file hasn't changed since this member was last synced successfully
+            signature = self.essentials_mirror.signature(profile["minecraft_uuid"])
+            if (
+                signature is not None
+                and self.nickname_sync_signatures.get(discord_id) == signature
+            ):
+                unchanged += 1
+                continue
+            to_check.append((member, profile, signature))
 
-            essentials_profile = await self.get_essentials_profile(
-                profile["minecraft_uuid"]
-            )
+        # Work out every needed change first, reading profiles with bounded concurrency
+        semaphore = Semaphore(self.nickname_sync_concurrency)
+        loop = get_running_loop()
 
-            if essentials_profile["success"] is False:
+        async def get_final_name(profile: Dict[str, Any]) -> Optional[str]:
+            try:
+                async with semaphore:
+                    essentials_data = await loop.run_in_executor(
+                        None,
+                        self.essentials_mirror.read_fields,
+                        profile["minecraft_uuid"],
+                    )
+                nickname = (essentials_data or {}).get("nickname")
+                # An empty 'nickname:' parses as None, fall back to the username for it too
+                if nickname is not None:
+                    nickname = strip_formatting(str(nickname)).strip()
+                    if nickname:
+                        return nickname
+            except Exception:
+                # Skip just this member, one unreadable userdata file shouldn't stop the sweep
+                log_error(f"[NameSync] {profile['minecraft_name']}\n{format_exc()}")
+                return None
+            return profile["minecraft_name"]
+
+        final_names = await gather(
+            *(get_final_name(profile) for _, profile, _ in to_check)
+        )
+        needed_changes = []
+        for (member, profile, signature), final_name in zip(to_check, final_names):
+            if final_name is None:
+                continue
+            if member.display_name.lower() != final_name.lower():
+                needed_changes.append((member, profile, signature, final_name))
+            elif signature is not None:
+                self.nickname_sync_signatures[member.id] = signature
+
+        # discord.py waits out the member edit rate limit itself
+        changed = 0
+        for member, profile, signature, final_name in needed_changes:
+            try:
+                await member.edit(nick=final_name)
+                changed += 1
+                if signature is not None:
+                    self.nickname_sync_signatures[member.id] = signature
+            except Exception:
+                error = format_exc()
                 log_error(
-                    f"Failure in 'get_essentials_profile' function for nickname_sync\n{profile}"
-                )
-            elif (
-                essentials_profile["data"] and "nickname" in essentials_profile["data"]
-            ):
-                final_name = re_sub(
-                    r"(§[a-zA-Z0-9])", "", essentials_profile["data"]["nickname"]
+                    f"[coroutine_nickname_sync] {member.display_name} / {profile['minecraft_name']}\n{error}"
                 )
-
-            if member.display_name.lower() != final_name.lower():
-                needed_change += 1
-                try:
-                    await member.edit(nick=final_name)
-                    changed += 1
-                except Exception:
-                    error = format_exc()
-                    log_error(
-                        f"[coroutine_nickname_sync] {member.display_name} / {profile['minecraft_username']}\n{error}"
-                    )
         print(
-            f"[NameSync] {found}/{len(self.discord_to_minecraft)} found, {changed}/{needed_change} changed"
+            f"[NameSync] {found}/{len(self.discord_to_minecraft)} found, {unchanged} unchanged, "
+            f"{changed}/{len(needed_changes)} changed in {perf_counter() - start_time:.2f}s"
         )
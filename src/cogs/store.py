@@ -1,21 +1,47 @@
 import json
-from datetime import datetime
+from asyncio import Event, Task
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import create_task, wait_for
+from functools import partial
+from hashlib import sha256
+from heapq import heapify, heappop, heappush
 from os import getenv
 from pathlib import Path
 from time import time
 from traceback import format_exc
-from typing import Any, Dict, List, Union
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import discord
-from discord.ext import commands, tasks
-from requests import post
-
+from discord.ext import commands
+
+from build_webhook import DebouncedWebhook
+from donation_ledger import (
+    DONATIONS_DATABASE_PATH,
+    LEGACY_PROGRESS_PATH,
+    DonationLedger,
+)
+from message_batcher import MessageBatcher
+from store_queue import TransactionQueue
 from utils import BotClass, do_log, get_est_time, json_load_eval, log_error
 
+# Re-check the clock at least this often, in case it jumped while sleeping
+TEMP_ROLE_MAX_SLEEP_SECONDS = 3600
+
 
 class Store(commands.Cog):
     def __init__(self, bot: BotClass):
         self.bot = bot
+        self.enabled = False
         self.backend_channel = bot.channels.get("store_backend", None)
         if self.backend_channel is None:
             log_error("['store_backend' channel not set, disabling store integration]")
@@ -47,17 +73,17 @@ class Store(commands.Cog):
             with open(self.temp_purchases_data_file_path, "w") as json_file:
                 json.dump(self.temp_purchases, json_file, indent=4)
 
+        # Min-heap of (expiry_timestamp, discord_id, role_id), next expiry first
+        self.temp_role_expiries: List[Tuple[int, int, int]] = []
+        self.temp_roles_wakeup = Event()
+        if self.schedule_temp_roles():
+            self.save_temp_purchases()
+        self.temp_roles_worker: Optional[Task] = None
+
         self.rcon_function = self.bot.client.get_cog(
             "MinecraftIntegration"
         ).rcon_command
 
-        is_rcon_functional = self.rcon_function(only_auth=True)
-        if not (is_rcon_functional):
-            log_error(
-                "[Could not establish RCON connection, disabling store integration]"
-            )
-            return
-
         self.discord_to_minecraft = self.bot.client.get_cog(
             "MinecraftIntegration"
         ).discord_to_minecraft
@@ -66,11 +92,76 @@ class Store(commands.Cog):
             "MinimumRole"
         ).check_member_has_minimum_role
 
-        self.monthly_progress_path = Path.cwd() / "data" / "monthly_progress"
+        self.donation_ledger = DonationLedger(Path.cwd() / DONATIONS_DATABASE_PATH)
+        imported = self.donation_ledger.import_legacy_totals(
+            Path.cwd() / LEGACY_PROGRESS_PATH
+        )
+        if imported:
+            do_log(
+                f"[Store] Imported {imported} monthly totals into the donation ledger"
+            )
+        self.bot.status_snapshot.update_donation_total(
+            self.donation_ledger.monthly_total()
+        )
+
+        # Purchases are queued durably on arrival and granted by 'process_transactions'
+        self.transaction_queue = TransactionQueue(
+            Path.cwd() / "data" / "store_transactions.sqlite3"
+        )
+        self.transaction_queue_wakeup = Event()
+        self.transaction_max_attempts = self.bot.CFG.get(
+            "store_transaction_max_attempts", 6
+        )
+        self.transaction_retry_seconds = self.bot.CFG.get(
+            "store_transaction_retry_seconds", 30
+        )
+        self.transaction_worker: Optional[Task] = None
 
-        self.remove_temp_roles.start()
+        self.transaction_log = MessageBatcher(
+            self.transactions_channel,
+            flush_interval=self.bot.CFG.get("store_log_flush_seconds", 10),
+            max_entries=self.bot.CFG.get("store_log_max_entries", 10),
+        )
+        self.builds_webhook = DebouncedWebhook(
+            getenv("BUILDS_WEBHOOK", ""),
+            window=self.bot.CFG.get("builds_webhook_debounce_seconds", 60),
+            timeout=self.bot.CFG.get("builds_webhook_timeout_seconds", 10),
+        )
+
+        self.enabled = True
+        self.temp_roles_worker = create_task(self.remove_temp_roles())
+        self.transaction_worker = create_task(self.process_transactions())
+        create_task(self.check_rcon())
+
+    async def check_rcon(self):
+        is_rcon_functional = await self.rcon_function(only_auth=True)
+        if not (is_rcon_functional):
+            # Purchases are still queued, and in-game items retried until RCON is back
+            log_error("[Store] Could not establish RCON connection, will keep retrying")
+
+    def cog_unload(self):
+        if not self.enabled:
+            return
+        if self.transaction_worker is not None:
+            self.transaction_worker.cancel()
+        if self.temp_roles_worker is not None:
+            self.temp_roles_worker.cancel()
+        self.transaction_queue.close()
+        self.donation_ledger.close()
+        self.transaction_log.flush()
+        create_task(self.builds_webhook.close())
+
+    async def log_transaction(self, transaction_obj: Dict, transaction_id: str):
+        # Recorded once per transaction id, so retrying this stage never double counts income
+        self.donation_ledger.record(
+            transaction_id,
+            float(transaction_obj.get("total", 0)),
+            str(transaction_obj.get("currency", "")),
+        )
+        self.bot.status_snapshot.update_donation_total(
+            self.donation_ledger.monthly_total()
+        )
 
-    async def log_transaction(self, transaction_obj: Dict):
         buy_time = get_est_time()
         user_name = transaction_obj.get("user_name")
         item_name = transaction_obj.get("item", {}).get("friendly_name")
@@ -78,42 +169,38 @@ class Store(commands.Cog):
         log_message = (
             f"__[{buy_time}]__\n``{user_name}`` bought ``{item_name}``\n{amount}"
         )
-        await self.transactions_channel.send(log_message)
-
-        current_goal_month = f"{datetime.now().strftime('%Y-%m')}.dat"
-        current_income = 0.0
-
-        try:
-            with open(
-                self.monthly_progress_path / current_goal_month, "r"
-            ) as data_file:
-                current_income = float(data_file.read())
-
-            current_income += float(transaction_obj.get("total", 0))
-
-            with open(
-                self.monthly_progress_path / current_goal_month, "w"
-            ) as data_file:
-                data_file.write(str(current_income))
-
-        except FileNotFoundError:
-            current_income += transaction_obj.get("total", 0)
-            Path(self.monthly_progress_path).mkdir(exist_ok=True)
-            with open(
-                self.monthly_progress_path / current_goal_month, "w"
-            ) as data_file:
-                data_file.write(str(current_income))
-
-        post(getenv("BUILDS_WEBHOOK", ""))
-
-    async def give_ingame_items(self, transaction_obj: Dict):
+        # Batched during bursts, and not awaited so posting never holds up the purchase
+        self.transaction_log.add(log_message)
+        # Rebuilds the static site so it picks up the new goal progress, once per burst
+        self.builds_webhook.trigger()
+
+    async def give_ingame_items(
+        self, transaction_obj: Dict, transaction_id: str, completed_stages: Set[str]
+    ) -> bool:
+        """
+        Runs the item's commands one at a time, recording each as its own 'items:<index>' stage
+        so a retry only runs the commands that hadn't gone through yet.
+        """
         command_templates = transaction_obj.get("item", {}).get("commands")
         if command_templates is None:
-            return
+            return True
 
         user_name = transaction_obj.get("user_name")
-        commands_to_run = [cmd.format(username=user_name) for cmd in command_templates]
+        for index, command_template in enumerate(command_templates):
+            stage = f"items:{index}"
+            if stage in completed_stages:
+                continue
+            command = command_template.format(username=user_name)
+            if not await self.rcon_function(cmd=command, isolated=True):
+                return False
+            self.transaction_queue.complete_stage(transaction_id, stage)
+        return True
+
+    async def announce_purchase(self, transaction_obj: Dict) -> bool:
+        if transaction_obj.get("item", {}).get("commands") is None:
+            return True
 
+        user_name = transaction_obj.get("user_name")
         item_name = transaction_obj.get("item", {}).get("friendly_name")
         raw_text_obj: List[Dict[str, Any]] = [
             {"text": "[LittleRpg Store] ", "color": "green"},
@@ -123,32 +210,50 @@ class Store(commands.Cog):
             {"text": "!", "color": "white"},
         ]
         tellraw_command = f"tellraw @a {json.dumps(raw_text_obj)}"
-        commands_to_run.append(tellraw_command)
-
-        self.rcon_function(cmds=commands_to_run)
+        return await self.rcon_function(cmd=tellraw_command, isolated=True)
 
     def log_temp_roles(
-        self, discord_id: int, temp_roles: List[Dict[str, Union[int, float]]]
-    ):
+        self,
+        discord_id: int,
+        temp_roles: List[Dict[str, Union[int, float, str]]],
+        transaction_id: str,
+    ) -> bool:
+        """
+        Schedules the removal of a transaction's temporary roles. Returns False if they were
+        already logged by an earlier attempt at the same transaction.
+        """
         entry = self.temp_purchases.get(discord_id, [])
+        if any(role.get("transaction_id") == transaction_id for role in entry):
+            return False
+        for role_entry in temp_roles:
+            role_entry["transaction_id"] = transaction_id
         entry = entry + temp_roles
         self.temp_purchases[discord_id] = entry
+        for role_entry in temp_roles:
+            heappush(
+                self.temp_role_expiries,
+                (
+                    int(role_entry["expiry_timestamp"]),
+                    discord_id,
+                    int(role_entry["role_id"]),
+                ),
+            )
+        self.temp_roles_wakeup.set()  # In case it expires before the current next expiry
+
+        self.save_temp_purchases()
+        return True
 
+    def save_temp_purchases(self):
         with open(self.temp_purchases_data_file_path, "w") as json_file:
             json.dump(self.temp_purchases, json_file, indent=4)
 
-    async def give_discord_roles(self, transaction_obj: Dict):
+    async def give_discord_roles(self, transaction_obj: Dict, transaction_id: str):
         roles: List[Dict] = transaction_obj.get("item", {}).get("discord_roles", None)
         if roles is None:
             return
 
         user_name = transaction_obj.get("user_name", "")
-        user_discord_id = None
-        for discord_id, profile in self.discord_to_minecraft.items():
-            # Default to different datatype to ensure no false matches (None, "ERROR", "N/A")
-            if profile.get("minecraft_name", -1).lower() == user_name.lower():
-                user_discord_id = discord_id
-                break
+        user_discord_id = self.discord_to_minecraft.discord_id_for_name(user_name)
         if user_discord_id is None:
             await self.error_log_channel.send(
                 f"Could not find {user_name}'s discord, but they bought something with a role!"
@@ -163,7 +268,8 @@ class Store(commands.Cog):
 
         roles_to_add = []
         roles_to_remove = []
-        temp_roles = []
+        temp_roles: List[Dict[str, Union[int, float, str]]] = []
+        temp_role_notices = []
         current_time = time()
         for role in roles:
             role_name = role.get("name", "role_name_not_found")
@@ -176,7 +282,6 @@ class Store(commands.Cog):
                 continue
             if role.get("add", True):
                 roles_to_add.append(role_instance)
-                # TODO: Daily role check to remove temp roles
                 days = role.get("duration_days", -1)
                 if days != -1:
                     temp_roles.append(
@@ -187,7 +292,7 @@ class Store(commands.Cog):
                             ),
                         }
                     )
-                    await self.error_log_channel.send(
+                    temp_role_notices.append(
                         f"{user_name} ({user_discord.name}#{user_discord.discriminator}) has purchased a temporary "
                         f"role ({role_instance.name} for {days} days).\nAutomatic role strip, or notification if "
                         "failed will occur, but keep an eye out regardless."
@@ -195,42 +300,92 @@ class Store(commands.Cog):
 
             else:
                 roles_to_remove.append(role_instance)
-        if temp_roles:
-            self.log_temp_roles(user_discord.id, temp_roles)
         if roles_to_add:
             await user_discord.add_roles(*roles_to_add)
         if roles_to_remove:
             await user_discord.remove_roles(*roles_to_remove)
-
-    @tasks.loop(seconds=60)
-    async def remove_temp_roles(self):
-        current_time = time()
-
-        for discord_id in self.temp_purchases:
-            discord_id = int(discord_id)
-            try:
-                member = self.bot.guild.get_member(discord_id)
-            except Exception:
-                do_log(
-                    f"[remove_temp_roles] Member with discord id '{discord_id}' not found"
-                )
-                continue
-            temp_roles = self.temp_purchases[discord_id]
-            remaining_roles = []
+        # Only once the roles are granted, and once per transaction however often it's retried
+        if temp_roles and self.log_temp_roles(
+            user_discord.id, temp_roles, transaction_id
+        ):
+            for notice in temp_role_notices:
+                await self.error_log_channel.send(notice)
+
+    def schedule_temp_roles(self) -> bool:
+        """
+        Builds the expiry heap from 'temp_purchases', dropping entries without a valid expiry.
+        Returns True if any were dropped.
+        """
+        self.temp_role_expiries = []
+        dropped = False
+        temp_purchases = self.temp_purchases
+        self.temp_purchases = {}
+        for discord_id, temp_roles in temp_purchases.items():
+            valid_roles = []
             for role_entry in temp_roles:
                 try:
                     expiry_timestamp = int(role_entry["expiry_timestamp"])
+                    role_id = int(role_entry["role_id"])
                 except Exception:
                     log_error(
                         f"[Temp Role] Could not get expiry_timestamp for discord id '{discord_id}'\n"
                         f"{temp_roles}\n"
                     )
+                    dropped = True
                     continue
-                if expiry_timestamp > current_time:
-                    remaining_roles.append(role_entry)
-                    continue
+                valid_roles.append(role_entry)
+                self.temp_role_expiries.append(
+                    (expiry_timestamp, int(discord_id), role_id)
+                )
+            if valid_roles:
+                self.temp_purchases[int(discord_id)] = valid_roles
+        heapify(self.temp_role_expiries)
+        return dropped
+
+    async def remove_temp_roles(self):
+        """
+        Sleeps until the next temporary role expires, then removes every role that is due and
+        checks only the members that lost one. The datafile is only written when roles expired.
+        """
+        while True:
+            self.temp_roles_wakeup.clear()
+            current_time = time()
+            if (
+                self.temp_role_expiries
+                and self.temp_role_expiries[0][0] <= current_time
+            ):
+                await self.remove_expired_temp_roles(current_time)
+                continue
+
+            timeout = TEMP_ROLE_MAX_SLEEP_SECONDS
+            if self.temp_role_expiries:
+                timeout = min(self.temp_role_expiries[0][0] - current_time, timeout)
+            try:
+                await wait_for(self.temp_roles_wakeup.wait(), timeout)
+            except AsyncTimeoutError:
+                pass
+
+    async def remove_expired_temp_roles(self, current_time: float):
+        expired: Dict[int, List[Tuple[int, int]]] = {}
+        while self.temp_role_expiries and self.temp_role_expiries[0][0] <= current_time:
+            expiry_timestamp, discord_id, role_id = heappop(self.temp_role_expiries)
+            expired.setdefault(discord_id, []).append((expiry_timestamp, role_id))
+
+        for discord_id, expired_roles in expired.items():
+            remaining_roles = [
+                role_entry
+                for role_entry in self.temp_purchases.get(discord_id, [])
+                if (int(role_entry["expiry_timestamp"]), int(role_entry["role_id"]))
+                not in expired_roles
+            ]
+            if remaining_roles:
+                self.temp_purchases[discord_id] = remaining_roles
+            else:
+                self.temp_purchases.pop(discord_id, None)
+
+            member = self.bot.guild.get_member(discord_id)
+            for _, role_id in expired_roles:
                 try:
-                    role_id = int(role_entry["role_id"])
                     role_instance = self.bot.guild.get_role(role_id)
                     if role_instance is None:
                         raise Exception(
@@ -255,14 +410,15 @@ class Store(commands.Cog):
                     f"Removed temporary role '{role_instance.name}' from discord member {member.mention}"
                 )
 
-            self.temp_purchases[discord_id] = remaining_roles
-            await self.check_member_has_minimum_role(member, do_warn=False)
+            if member is not None:
+                await self.check_member_has_minimum_role(member, do_warn=False)
 
-        with open(self.temp_purchases_data_file_path, "w") as json_file:
-            json.dump(self.temp_purchases, json_file, indent=4)
+        self.save_temp_purchases()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        if not self.enabled:
+            return
         if message.channel.id != self.backend_channel.id:
             return
 
@@ -273,6 +429,100 @@ class Store(commands.Cog):
             log_error(f"[Store] Failed to make transaction into dict {message.content}")
             return
 
-        await self.log_transaction(transaction_obj)
-        await self.give_ingame_items(transaction_obj)
-        await self.give_discord_roles(transaction_obj)
+        # The webhook's transaction id, so a re-sent purchase isn't granted twice
+        transaction_id = str(
+            transaction_obj.get("transaction_id") or transaction_obj.get("id") or ""
+        )
+        if not transaction_id:
+            # Otherwise the payload itself, so a redelivered message still has the same key
+            canonical_payload = json.dumps(transaction_obj, sort_keys=True)
+            transaction_id = (
+                f"payload-{sha256(canonical_payload.encode('utf-8')).hexdigest()}"
+            )
+            log_error(
+                f"[Store] Purchase has no transaction id, deduplicating it by its contents as "
+                f"'{transaction_id}'\n{message.content}"
+            )
+        if not self.transaction_queue.add(transaction_id, transaction_obj):
+            do_log(f"[Store] Ignoring duplicate transaction '{transaction_id}'")
+            return
+        self.transaction_queue_wakeup.set()
+
+    async def process_transactions(self):
+        """
+        Works through queued purchases oldest first. A purchase that fails is retried with
+        exponential backoff from the stage that failed, and reported to staff once it runs out
+        of attempts.
+        """
+        while True:
+            self.transaction_queue_wakeup.clear()
+            queued = self.transaction_queue.next_due(time())
+            if queued is None:
+                next_attempt_time = self.transaction_queue.next_attempt_time()
+                timeout = None
+                if next_attempt_time is not None:
+                    timeout = max(next_attempt_time - time(), 0)
+                try:
+                    await wait_for(self.transaction_queue_wakeup.wait(), timeout)
+                except AsyncTimeoutError:
+                    pass
+                continue
+
+            transaction_id, transaction_obj, attempts, completed_stages = queued
+            try:
+                await self.process_transaction(
+                    transaction_id, transaction_obj, completed_stages
+                )
+            except Exception:
+                error = format_exc()
+                log_error(f"[Store] Transaction '{transaction_id}' failed\n{error}")
+                if attempts + 1 < self.transaction_max_attempts:
+                    delay = self.transaction_retry_seconds * 2**attempts
+                    self.transaction_queue.retry_later(transaction_id, error, delay)
+                    continue
+                self.transaction_queue.fail(transaction_id, error)
+                try:
+                    await self.error_log_channel.send(
+                        f"Gave up on transaction '{transaction_id}' after {attempts + 1} attempts, "
+                        "check bot error logs. Use `/storeretry` once the issue is fixed."
+                    )
+                except Exception:
+                    log_error(format_exc())
+
+    async def process_transaction(
+        self, transaction_id: str, transaction_obj: Dict, completed_stages: Set[str]
+    ):
+        stages: Tuple[Tuple[str, Callable[[Dict], Awaitable[Any]]], ...] = (
+            ("log", partial(self.log_transaction, transaction_id=transaction_id)),
+            (
+                "items",
+                partial(
+                    self.give_ingame_items,
+                    transaction_id=transaction_id,
+                    completed_stages=completed_stages,
+                ),
+            ),
+            ("announce", self.announce_purchase),
+            ("roles", partial(self.give_discord_roles, transaction_id=transaction_id)),
+        )
+        for stage, function in stages:
+            if stage in completed_stages:
+                continue
+            if await function(transaction_obj) is False:
+                raise ConnectionError(f"Stage '{stage}' did not complete")
+            self.transaction_queue.complete_stage(transaction_id, stage)
+        self.transaction_queue.complete(transaction_id)
+
+    @commands.command(name="storequeue")
+    async def store_queue(self, ctx: commands.Context):
+        if ctx.author.id != self.bot.CFG["discord_bot_owner_id"]:
+            return
+        await ctx.send(f"Store transactions: {self.transaction_queue.stats()}")
+
+    @commands.command(name="storeretry")
+    async def store_retry(self, ctx: commands.Context):
+        if ctx.author.id != self.bot.CFG["discord_bot_owner_id"]:
+            return
+        requeued = self.transaction_queue.requeue_failed()
+        self.transaction_queue_wakeup.set()
+        await ctx.send(f"Requeued {requeued} failed transaction(s)")
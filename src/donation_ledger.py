@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Optional, Tuple
+
+DONATIONS_DATABASE_PATH = Path("data") / "donations.sqlite3"
+LEGACY_PROGRESS_PATH = Path("data") / "monthly_progress"
+
+
+def current_month() -> str:
+    return datetime.now().strftime("%Y-%m")
+
+
+class DonationLedger:
+    """
+    Append-only ledger of store income in SQLite (WAL), shared by the bot and the webserver.
+    Each transaction is recorded once by id, and its month's running total is updated in the
+    same database transaction, so readers always see a total that matches the ledger and a
+    retried purchase is never counted twice. Readers never block the bot's writes.
+    """
+
+    def __init__(self, database_path: Path, read_only: bool = False):
+        self.database_path = database_path
+        self.read_only = read_only
+        self.connection: Optional[sqlite3.Connection] = None
+        # Webserver handlers may run on a thread pool
+        self.lock = Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.connection is not None:
+            return self.connection
+        if self.read_only:
+            if not self.database_path.exists():
+                return None  # Nothing recorded yet, and readers don't create it
+            self.connection = sqlite3.connect(
+                f"file:{self.database_path}?mode=ro",
+                uri=True,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            return self.connection
+
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            str(self.database_path), isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS donations (
+                transaction_id TEXT PRIMARY KEY,
+                month TEXT NOT NULL,
+                amount REAL NOT NULL,
+                currency TEXT NOT NULL,
+                recorded_time REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                month TEXT PRIMARY KEY,
+                total REAL NOT NULL
+            );
+            """
+        )
+        return self.connection
+
+    def record(
+        self,
+        transaction_id: str,
+        amount: float,
+        currency: str = "",
+        month: Optional[str] = None,
+    ) -> bool:
+        """
+        Records a transaction and adds it to its month's total, returns False if this
+        transaction id was already recorded.
+        """
+        month = month or current_month()
+        with self.lock:
+            connection = self._connect()
+            if connection is None:  # Read-only, and the database doesn't exist yet
+                raise sqlite3.OperationalError("Can't record to a read-only ledger")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = connection.execute(
+                    "INSERT OR IGNORE INTO donations"
+                    " (transaction_id, month, amount, currency, recorded_time)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (transaction_id, month, amount, currency, time()),
+                ).rowcount
+                if inserted:
+                    connection.execute(
+                        "INSERT INTO monthly_totals (month, total) VALUES (?, ?)"
+                        " ON CONFLICT (month) DO UPDATE SET total = total + excluded.total",
+                        (month, amount),
+                    )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return inserted == 1
+
+    def monthly_total(self, month: Optional[str] = None) -> float:
+        with self.lock:
+            connection = self._connect()
+            if connection is None:
+                return 0.0
+            try:
+                row = connection.execute(
+                    "SELECT total FROM monthly_totals WHERE month = ?",
+                    (month or current_month(),),
+                ).fetchone()
+            except sqlite3.OperationalError:
+                return 0.0  # Created by the bot, but tables not yet committed
+        return row[0] if row is not None else 0.0
+
+    def change_signature(self) -> Tuple[int, ...]:
+        """
+        Changes whenever a write is committed or checkpointed, checked without opening the
+        database (a commit appends to the WAL file, a checkpoint rewrites the database file).
+        """
+        signature = []
+        for path in (self.database_path, Path(f"{self.database_path}-wal")):
+            try:
+                stat = path.stat()
+                signature += [stat.st_mtime_ns, stat.st_size]
+            except FileNotFoundError:
+                signature += [0, 0]
+        return tuple(signature)
+
+    def import_legacy_totals(self, progress_path: Path) -> int:
+        """
+        Imports the monthly totals from the old 'YYYY-MM.dat' files, once per month, as a single
+        ledger entry each. Returns how many months were imported.
+        """
+        imported = 0
+        for data_file_path in sorted(progress_path.glob("*.dat")):
+            try:
+                amount = float(data_file_path.read_text())
+            except ValueError:
+                continue
+            month = data_file_path.stem
+            if self.record(f"legacy-{month}", amount, month=month):
+                imported += 1
+        return imported
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,182 @@
+import json
+from asyncio import Semaphore, gather, get_running_loop
+from ftplib import FTP  # nosec
+from ftplib import error_perm  # nosec
+from os import replace as os_replace
+from pathlib import Path
+from time import perf_counter
+from traceback import format_exc
+from typing import Any, Dict, List, Optional, Tuple
+
+from yaml import YAMLError
+from yaml import safe_load as yaml_safe_load
+
+from ftp_pool import FTPPool
+from utils import log_error
+
+ESSENTIALS_FIELDS = ("nickname",)
+ESSENTIALS_USERDATA_PATH = "/plugins/Essentials/userdata"
+
+
+def parse_essentials_fields(
+    yml_lines: List[str], fields: Tuple[str, ...] = ESSENTIALS_FIELDS
+) -> Dict[str, Any]:
+    """
+    Extracts only the given top-level scalar fields from an Essentials userdata file, parsing
+    just their lines instead of the whole YAML document. Falls back to parsing the whole
+    document for values that don't fit on their own line (continued or otherwise invalid alone).
+    """
+    found: Dict[str, Any] = {}
+    prefixes = tuple(f"{field}:" for field in fields)
+    for index, line in enumerate(yml_lines):
+        if not line.startswith(prefixes):  # Top-level keys aren't indented
+            continue
+        next_line = yml_lines[index + 1] if index + 1 < len(yml_lines) else ""
+        if next_line[:1].isspace():  # Value continues on the next line
+            return parse_essentials_document(yml_lines, fields)
+        try:
+            parsed = yaml_safe_load(line)
+        except YAMLError:
+            return parse_essentials_document(yml_lines, fields)
+        if isinstance(parsed, dict):
+            found.update(parsed)
+        if len(found) == len(fields):
+            break
+    return found
+
+
+def parse_essentials_document(
+    yml_lines: List[str], fields: Tuple[str, ...] = ESSENTIALS_FIELDS
+) -> Dict[str, Any]:
+    document = yaml_safe_load("\n".join(yml_lines))
+    if not isinstance(document, dict):
+        return {}
+    return {field: document[field] for field in fields if field in document}
+
+
+def list_userdata(ftp: FTP, remote_path: str) -> Dict[str, str]:
+    """
+    Lists the userdata directory in one request, mapping each file name to a signature that
+    changes whenever the file does (modification time and size).
+    """
+    try:
+        return {
+            name: f"{facts.get('modify', '')}|{facts.get('size', '')}"
+            for name, facts in ftp.mlsd(remote_path, facts=["type", "modify", "size"])
+            if facts.get("type") == "file" and name.endswith(".yml")
+        }
+    except error_perm:  # Server without MLSD, fall back to parsing a unix style LIST
+        lines: List[str] = []
+        ftp.retrlines(f"LIST {remote_path}", lines.append)
+        listing = {}
+        for line in lines:
+            parts = line.split(maxsplit=8)
+            if len(parts) == 9 and parts[8].endswith(".yml"):
+                listing[parts[8]] = " ".join(parts[4:8])  # Size and date columns
+        return listing
+
+
+def download_file(ftp: FTP, remote_file_path: str, local_file_path: Path):
+    temp_path = local_file_path.with_suffix(".tmp")
+    with open(temp_path, "wb") as local_file:
+        ftp.retrbinary(f"RETR {remote_file_path}", local_file.write)
+    os_replace(temp_path, local_file_path)
+
+
+class EssentialsMirror:
+    """
+    Local copy of the Essentials userdata directory. Each sync lists the remote directory once
+    and only downloads files whose modification time or size changed since the last sync.
+    """
+
+    def __init__(
+        self,
+        ftp_pool: FTPPool,
+        mirror_path: Path,
+        remote_path: str = ESSENTIALS_USERDATA_PATH,
+    ):
+        self.ftp_pool = ftp_pool
+        self.mirror_path = mirror_path
+        self.remote_path = remote_path
+        self.index_file_path = mirror_path / "index.json"
+
+        self.mirror_path.mkdir(parents=True, exist_ok=True)
+        self.index: Dict[str, str] = {}  # File name -> remote signature
+        try:
+            with open(self.index_file_path, "r") as index_file:
+                self.index = json.load(index_file)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    async def sync(self) -> str:
+        """
+        Brings the mirror up to date and returns a one-line timing report.
+        """
+        start_time = perf_counter()
+        listing = await self.ftp_pool.run(list_userdata, self.remote_path)
+        list_time = perf_counter() - start_time
+
+        changed = [
+            name
+            for name, signature in listing.items()
+            if self.index.get(name) != signature
+            or not (self.mirror_path / name).exists()
+        ]
+        removed = [name for name in self.index if name not in listing]
+
+        # Pool sessions limit how many downloads can actually run at once
+        semaphore = Semaphore(self.ftp_pool.size)
+
+        async def fetch(name: str) -> bool:
+            async with semaphore:
+                try:
+                    await self.ftp_pool.run(
+                        download_file,
+                        f"{self.remote_path}/{name}",
+                        self.mirror_path / name,
+                    )
+                except Exception:
+                    log_error(
+                        f"[EssentialsMirror] Failed to fetch {name}\n{format_exc()}"
+                    )
+                    return False
+            self.index[name] = listing[name]
+            return True
+
+        fetched = sum(await gather(*(fetch(name) for name in changed)))
+        for name in removed:
+            del self.index[name]
+            (self.mirror_path / name).unlink(missing_ok=True)
+
+        await get_running_loop().run_in_executor(None, self.save_index)
+        return (
+            f"[EssentialsMirror] {len(listing)} listed in {list_time:.2f}s, "
+            f"{fetched} fetched, {len(listing) - len(changed)} skipped, "
+            f"{len(changed) - fetched} failed, {len(removed)} removed, "
+            f"{perf_counter() - start_time:.2f}s total"
+        )
+
+    def save_index(self):
+        temp_path = self.index_file_path.with_suffix(".tmp")
+        with open(temp_path, "w") as index_file:
+            json.dump(self.index, index_file)
+        os_replace(temp_path, self.index_file_path)
+
+    def signature(self, uuid: str) -> Optional[str]:
+        """
+        Returns the remote signature of a player's mirrored userdata file, which changes whenever
+        the file does.
+        """
+        return self.index.get(f"{uuid}.yml")
+
+    def read_fields(self, uuid: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the fields we use from the mirrored userdata file, or None if it isn't mirrored.
+        """
+        try:
+            with open(
+                self.mirror_path / f"{uuid}.yml", "r", encoding="utf-8"
+            ) as yml_file:
+                return parse_essentials_fields(yml_file.read().splitlines())
+        except FileNotFoundError:
+            return None
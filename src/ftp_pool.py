@@ -0,0 +1,182 @@
+from asyncio import get_running_loop, wait_for
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import FTP  # nosec
+from ftplib import error_perm  # nosec
+from threading import Condition
+from time import monotonic
+from typing import Any, Callable, Deque, List, Tuple, TypeVar
+
+from utils import do_log
+
+ResultType = TypeVar("ResultType")
+
+
+class FTPPool:
+    """
+    Small pool of long-lived, logged-in FTP sessions. Every FTP call runs in the pool's own
+    worker threads, so slow FTP responses never block the event loop. Broken sessions are
+    reconnected transparently, and idle ones are kept alive with NOOP by 'keepalive'.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        port: int = 21,
+        size: int = 2,
+        timeout: float = 10.0,
+        keepalive_interval: float = 60.0,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.size, thread_name_prefix="ftp_pool"
+        )
+        # Never more than 'size' sessions open (idle or in use), FTP hosts cap them per user
+        self.available = Condition()
+        self.open_sessions = 0
+        self.idle: Deque[Tuple[FTP, float]] = deque()  # (session, last used time)
+
+    def _connect(self) -> FTP:
+        # No control over host, have to use ftp even if insecure
+        ftp = FTP(timeout=self.timeout)  # nosec
+        ftp.connect(self.host, self.port)
+        ftp.login(self.username, self.password)
+        return ftp
+
+    def _close_session(self, ftp: FTP):
+        try:
+            ftp.close()
+        except Exception:  # Already broken, nothing else to clean up
+            pass
+
+    def _discard(self, ftp: FTP):
+        self._close_session(ftp)
+        with self.available:
+            self.open_sessions -= 1
+            self.available.notify()
+
+    def _open(self) -> FTP:
+        """
+        Connects a new session once there's room for it, closing an idle one to make room if
+        needed, otherwise waiting for a session to be discarded.
+        """
+        replaced = None
+        with self.available:
+            while self.open_sessions >= self.size and not self.idle:
+                self.available.wait()
+            if self.open_sessions >= self.size:
+                replaced, _ = self.idle.popleft()
+            else:
+                self.open_sessions += 1
+        if replaced is not None:
+            self._close_session(replaced)  # Its slot goes to the new session
+        try:
+            return self._connect()
+        except Exception:
+            with self.available:
+                self.open_sessions -= 1
+                self.available.notify()
+            raise
+
+    def _acquire(self) -> FTP:
+        with self.available:
+            while not self.idle and self.open_sessions >= self.size:
+                self.available.wait()  # Every session is in use, wait for a release
+            if not self.idle:
+                ftp = None
+            else:
+                ftp, last_used = self.idle.popleft()
+        if ftp is None:
+            return self._open()
+        if monotonic() - last_used < self.keepalive_interval:
+            return ftp
+        try:
+            ftp.voidcmd("NOOP")  # Idle for a while, make sure the server didn't drop it
+            return ftp
+        except Exception:
+            self._discard(ftp)
+            return self._open()
+
+    def _release(self, ftp: FTP):
+        with self.available:
+            if len(self.idle) < self.size:
+                self.idle.append((ftp, monotonic()))
+                self.available.notify()
+                return
+        self._discard(ftp)
+
+    def _attempt(
+        self, ftp: FTP, operation: Callable[..., ResultType], args: Tuple
+    ) -> ResultType:
+        try:
+            result = operation(ftp, *args)
+        except error_perm:
+            self._release(ftp)  # e.g. missing file, the session itself is fine
+            raise
+        except Exception:
+            self._discard(ftp)
+            raise
+        self._release(ftp)
+        return result
+
+    def _run(self, operation: Callable[..., ResultType], *args: Any) -> ResultType:
+        try:
+            return self._attempt(self._acquire(), operation, args)
+        except error_perm:
+            raise
+        except Exception:
+            # Possibly a session the server dropped, retry once on a fresh one
+            return self._attempt(self._open(), operation, args)
+
+    async def run(self, operation: Callable[..., ResultType], *args: Any) -> ResultType:
+        """
+        Runs 'operation(ftp, *args)' on a pooled session in the pool's threads, giving up after
+        the per-operation timeout.
+        """
+        return await wait_for(
+            get_running_loop().run_in_executor(
+                self.executor, self._run, operation, *args
+            ),
+            self.timeout * 2,  # Connect and operation can each take up to 'timeout'
+        )
+
+    def _keepalive(self):
+        # Only stale sessions are taken out, the rest stay available to operations meanwhile
+        stale = []
+        with self.available:
+            for session in list(self.idle):
+                if monotonic() - session[1] >= self.keepalive_interval:
+                    self.idle.remove(session)
+                    stale.append(session)
+        for ftp, _ in stale:
+            try:
+                ftp.voidcmd("NOOP")
+                self._release(ftp)
+            except Exception:
+                self._discard(ftp)
+                do_log("[FTPPool] Dropped a dead FTP session")
+
+    async def keepalive(self):
+        await get_running_loop().run_in_executor(self.executor, self._keepalive)
+
+    def close(self):
+        with self.available:
+            idle, self.idle = self.idle, deque()
+        for ftp, _ in idle:
+            self._discard(ftp)
+        self.executor.shutdown(wait=False)
+
+
+def retrieve_lines(ftp: FTP, path: str) -> List[str]:
+    lines: List[str] = []
+    ftp.retrlines(f"RETR {path}", lines.append)
+    return lines
@@ -0,0 +1,83 @@
+from asyncio import Lock, Task, create_task, sleep
+from time import monotonic
+from traceback import format_exc
+from typing import List, Optional
+
+import discord
+
+from utils import log_error
+
+DISCORD_MESSAGE_LIMIT = 2000
+ENTRY_SEPARATOR = "\n"
+
+
+class MessageBatcher:
+    """
+    Posts log entries to a channel without waiting on Discord. An entry is sent right away if
+    nothing was sent in the last 'flush_interval' seconds; otherwise entries are buffered and
+    sent together as one message when the interval is up, when 'max_entries' are buffered, or
+    when another entry wouldn't fit in a single message. Messages are sent in order.
+    """
+
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        flush_interval: float = 10.0,
+        max_entries: int = 10,
+    ):
+        self.channel = channel
+        self.flush_interval = flush_interval
+        self.max_entries = max(int(max_entries), 1)
+        self.buffer: List[str] = []
+        self.buffer_length = 0
+        self.last_send_time = float("-inf")
+        self.flush_timer: Optional[Task] = None
+        self.send_lock = Lock()  # Waiters get it in order, so messages stay in order
+        self.entries_sent = 0
+        self.messages_sent = 0
+
+    def add(self, entry: str):
+        entry = entry[:DISCORD_MESSAGE_LIMIT]
+        if not self.buffer and monotonic() - self.last_send_time >= self.flush_interval:
+            self._send([entry])
+            return
+
+        separator_length = len(ENTRY_SEPARATOR) if self.buffer else 0
+        if self.buffer_length + separator_length + len(entry) > DISCORD_MESSAGE_LIMIT:
+            self.flush()
+            separator_length = 0
+        self.buffer.append(entry)
+        self.buffer_length += separator_length + len(entry)
+        if len(self.buffer) >= self.max_entries:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = create_task(self._flush_later())
+
+    def flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.buffer:
+            self._send(self.buffer)
+            self.buffer = []
+            self.buffer_length = 0
+
+    async def _flush_later(self):
+        await sleep(max(self.last_send_time + self.flush_interval - monotonic(), 0))
+        self.flush_timer = None
+        self.flush()
+
+    def _send(self, entries: List[str]):
+        self.last_send_time = monotonic()
+        create_task(self._post(ENTRY_SEPARATOR.join(entries), len(entries)))
+
+    async def _post(self, content: str, entry_count: int):
+        async with self.send_lock:
+            try:
+                await self.channel.send(content)
+                self.entries_sent += entry_count
+                self.messages_sent += 1
+            except Exception:
+                log_error(
+                    f"[MessageBatcher] Failed to send log message\n{format_exc()}"
+                )
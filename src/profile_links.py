@@ -0,0 +1,208 @@
+import json
+from os import fsync
+from os import replace as os_replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, MutableMapping, Optional, TextIO, Union
+
+from utils import do_log
+
+PROFILE_FIELDS = ("minecraft_name", "minecraft_uuid", "discord_name")
+
+
+class ProfileLink:
+    """
+    A single Discord-to-Minecraft link. Compact, but still readable like the dict it replaced.
+    """
+
+    __slots__ = PROFILE_FIELDS
+
+    def __init__(
+        self, minecraft_name: str, minecraft_uuid: str, discord_name: str = ""
+    ):
+        self.minecraft_name = minecraft_name
+        self.minecraft_uuid = minecraft_uuid
+        # Not kept up-to-date, just human-readable indicator
+        self.discord_name = discord_name
+
+    @classmethod
+    def from_dict(cls, profile: Dict[str, Any]) -> "ProfileLink":
+        return cls(
+            str(profile.get("minecraft_name", "")),
+            str(profile.get("minecraft_uuid", "")),
+            str(profile.get("discord_name", "")),
+        )
+
+    def __getitem__(self, key: str) -> str:
+        if key not in PROFILE_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in PROFILE_FIELDS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in PROFILE_FIELDS else default
+
+    def to_dict(self) -> Dict[str, str]:
+        return {field: getattr(self, field) for field in PROFILE_FIELDS}
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class ProfileLinks(MutableMapping[int, ProfileLink]):
+    """
+    Discord id to ProfileLink mapping, with reverse indexes by Minecraft uuid and lowercased
+    Minecraft name that are kept consistent on every change, so lookups in either direction
+    don't depend on how many players are linked.
+    """
+
+    def __init__(self, links: Optional[Dict[int, Any]] = None):
+        self.links: Dict[int, ProfileLink] = {}
+        # Dicts used as insertion-ordered sets, in case the same account is linked twice
+        self.ids_by_uuid: Dict[str, Dict[int, None]] = {}
+        self.ids_by_name: Dict[str, Dict[int, None]] = {}
+        for discord_id, profile in (links or {}).items():
+            self[discord_id] = profile
+
+    def __getitem__(self, discord_id: int) -> ProfileLink:
+        return self.links[discord_id]
+
+    def __setitem__(self, discord_id: int, profile: Union[ProfileLink, Dict[str, Any]]):
+        if not isinstance(profile, ProfileLink):
+            profile = ProfileLink.from_dict(profile)
+        if discord_id in self.links:
+            self._unindex(discord_id, self.links[discord_id])
+        self.links[discord_id] = profile
+        for index, key in self._index_keys(profile):
+            index.setdefault(key, {})[discord_id] = None
+
+    def __delitem__(self, discord_id: int):
+        self._unindex(discord_id, self.links.pop(discord_id))
+
+    def _index_keys(self, profile: ProfileLink):
+        return (
+            (self.ids_by_uuid, profile.minecraft_uuid),
+            (self.ids_by_name, profile.minecraft_name.lower()),
+        )
+
+    def _unindex(self, discord_id: int, profile: ProfileLink):
+        for index, key in self._index_keys(profile):
+            discord_ids = index.get(key, {})
+            discord_ids.pop(discord_id, None)
+            if not discord_ids:
+                index.pop(key, None)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.links)
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def __contains__(self, discord_id: object) -> bool:
+        return discord_id in self.links
+
+    def discord_id_for_uuid(self, minecraft_uuid: str) -> Optional[int]:
+        return next(iter(self.ids_by_uuid.get(minecraft_uuid, ())), None)
+
+    def discord_id_for_name(self, minecraft_name: str) -> Optional[int]:
+        return next(iter(self.ids_by_name.get(minecraft_name.lower(), ())), None)
+
+    def to_dict(self) -> Dict[int, Dict[str, str]]:
+        return {
+            discord_id: profile.to_dict() for discord_id, profile in self.links.items()
+        }
+
+
+class ProfileLinksJournal:
+    """
+    Persists ProfileLinks as a JSON snapshot plus an append-only journal of link events, so a
+    new link costs one small append instead of rewriting every link. 'compact' folds the
+    journal back into the snapshot. A half-written last journal line (crash mid-append) is
+    skipped on load, and the snapshot is only ever replaced atomically.
+    """
+
+    def __init__(self, snapshot_path: Path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path.with_suffix(".journal")
+        # Journal being folded into the snapshot, while new links go to a fresh journal
+        self.compacting_journal_path = snapshot_path.with_suffix(".journal.compacting")
+        self.journal_file: Optional[TextIO] = None
+        self.journal_entries = 0
+
+    def load(self) -> ProfileLinks:
+        links = ProfileLinks()
+        try:
+            with open(self.snapshot_path, "r") as snapshot_file:
+                for discord_id, profile in json.load(snapshot_file).items():
+                    links[int(discord_id)] = profile
+        except FileNotFoundError:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.journal_entries = 0
+        for journal_path in (self.compacting_journal_path, self.journal_path):
+            self.journal_entries += self._replay(journal_path, links)
+        return links
+
+    @staticmethod
+    def _replay(journal_path: Path, links: ProfileLinks) -> int:
+        replayed = 0
+        try:
+            with open(journal_path, "r") as journal_file:
+                for line in journal_file:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        do_log(
+                            f"[ProfileLinks] Skipping incomplete entry in {journal_path}"
+                        )
+                        continue
+                    links[int(entry["discord_id"])] = entry["profile"]
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return replayed
+
+    def _append(self, entry: Dict[str, Any]):
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_path, "a")
+        # Leading newline keeps a half-written previous line from swallowing this one
+        self.journal_file.write("\n" + json.dumps(entry))
+        self.journal_file.flush()
+        self.journal_entries += 1
+
+    def append_link(self, discord_id: int, profile: ProfileLink):
+        self._append(
+            {"op": "link", "discord_id": discord_id, "profile": profile.to_dict()}
+        )
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    def start_compaction(self, links: ProfileLinks) -> Dict[int, Dict[str, str]]:
+        """
+        Switches new appends to a fresh journal and returns the snapshot data to write with
+        'finish_compaction'. Must run on the same thread as the appends (the event loop).
+        """
+        self.close()
+        if self.journal_path.exists() and not self.compacting_journal_path.exists():
+            os_replace(self.journal_path, self.compacting_journal_path)
+        self.journal_entries = 0
+        return links.to_dict()
+
+    def finish_compaction(self, snapshot: Dict[int, Dict[str, str]]):
+        """
+        Writes the snapshot and drops the journal it replaces. Blocking, safe to run in an
+        executor while new links are appended.
+        """
+        temp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(temp_path, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file, indent=4)
+            snapshot_file.flush()
+            fsync(snapshot_file.fileno())
+        os_replace(temp_path, self.snapshot_path)
+        self.compacting_journal_path.unlink(missing_ok=True)
@@ -0,0 +1,412 @@
+from asyncio import (
+    Event,
+    Future,
+    Lock,
+    StreamReader,
+    StreamWriter,
+    Task,
+    create_task,
+    gather,
+    get_running_loop,
+    open_connection,
+    sleep,
+    wait_for,
+)
+from collections import deque
+from json import dumps as json_dumps
+from struct import pack, unpack
+from time import monotonic
+from typing import Deque, Dict, List, Optional
+
+from tellraw import join_json_arrays
+from utils import do_log
+
+PACKET_TYPE_RESPONSE = 0
+PACKET_TYPE_COMMAND = 2
+PACKET_TYPE_LOGIN = 3
+AUTH_FAILED_REQUEST_ID = -1
+MAX_COMMAND_LENGTH = 1446  # Longest command body the Minecraft server accepts
+CHAT_DESTINATION = "chat"
+CHAT_LINE_BREAK = json_dumps([{"text": "\n"}])
+
+
+class RCONError(ConnectionError):
+    pass
+
+
+class AsyncRCONClient:
+    """
+    Native asyncio RCON client that keeps one authenticated connection open and matches
+    responses to commands by request id, so commands never block the event loop and don't pay
+    for a connect and login each time. After a failed connection attempt, further attempts are
+    refused until an exponentially growing backoff has passed.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str,
+        timeout: float = 5.0,
+        max_backoff: float = 60.0,
+    ):
+        self.host = host
+        self.port = int(port)
+        self.password = password
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+
+        self.reader: Optional[StreamReader] = None
+        self.writer: Optional[StreamWriter] = None
+        self.read_task: Optional[Task] = None
+        self.pending: Dict[int, Future] = {}
+        self.last_request_id = 0
+        self.connect_lock: Optional[Lock] = None
+        self.backoff = 0.0
+        self.next_attempt_time = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def _next_request_id(self) -> int:
+        self.last_request_id = (self.last_request_id % 0x7FFFFFFF) + 1
+        return self.last_request_id
+
+    async def connect(self):
+        """
+        Opens and authenticates the connection if it isn't already, honouring the backoff.
+        """
+        if self.connect_lock is None:
+            self.connect_lock = Lock()
+        async with self.connect_lock:
+            if self.connected:
+                return
+            if monotonic() < self.next_attempt_time:
+                raise RCONError(
+                    f"RCON reconnect backing off for {self.next_attempt_time - monotonic():.1f}s"
+                )
+            try:
+                await self._open()
+            except Exception:
+                await self.close()
+                self.backoff = min(max(self.backoff * 2, 1.0), self.max_backoff)
+                self.next_attempt_time = monotonic() + self.backoff
+                raise
+            self.backoff = 0.0
+            self.next_attempt_time = 0.0
+
+    async def _open(self):
+        self.reader, self.writer = await wait_for(
+            open_connection(self.host, self.port), self.timeout
+        )
+        self.read_task = create_task(self._read_loop(self.reader))
+        try:
+            await self._request(PACKET_TYPE_LOGIN, self.password)
+        except RCONError:
+            raise RCONError("RCON failed to authenticate") from None
+        do_log(f"[RCON] Connected to {self.host}:{self.port}")
+
+    async def close(self):
+        writer, read_task = self.writer, self.read_task
+        self.reader, self.writer, self.read_task = None, None, None
+        if read_task is not None:
+            read_task.cancel()
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:  # Connection may already be gone
+                pass
+        self._fail_pending(RCONError("RCON connection closed"))
+
+    def _fail_pending(self, error: Exception):
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_loop(self, reader: StreamReader):
+        try:
+            while True:
+                (length,) = unpack("<i", await reader.readexactly(4))
+                payload = await reader.readexactly(length)
+                request_id, _packet_type = unpack("<ii", payload[:8])
+                body = payload[8:-2].decode("utf-8", errors="replace")
+
+                if request_id == AUTH_FAILED_REQUEST_ID:
+                    self._fail_pending(RCONError("RCON authentication refused"))
+                    continue
+                # Responses over 4096 bytes arrive split; only the first part is kept
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(body)
+        except Exception as e:
+            if self.reader is reader:
+                writer = self.writer
+                self.reader, self.writer = None, None  # Let the next command reconnect
+                if writer is not None:
+                    writer.close()
+            self._fail_pending(RCONError(f"RCON connection lost: {e!r}"))
+
+    async def _request(self, packet_type: int, body: str) -> str:
+        if self.writer is None:
+            raise RCONError("RCON not connected")
+        request_id = self._next_request_id()
+        encoded_body = body.encode("utf-8")
+        packet = (
+            pack("<iii", len(encoded_body) + 10, request_id, packet_type)
+            + encoded_body
+            + (b"\x00\x00")
+        )
+
+        future = get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.write(packet)
+            await self.writer.drain()
+            return await wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def command(self, command: str) -> str:
+        """
+        Runs a single command, reconnecting first if needed, and returns the server's response.
+        """
+        await self.connect()
+        writer = self.writer
+        try:
+            return await self._request(PACKET_TYPE_COMMAND, command)
+        except RCONError:
+            # That connection is in an unknown state, start fresh next time. Unless it was
+            # already replaced, other commands may be waiting on the new one
+            if self.writer is writer:
+                await self.close()
+            raise
+
+
+class QueuedCommand:
+    __slots__ = ("command", "chat_json", "future", "queued_time")
+
+    def __init__(self, command: str, chat_json: str = ""):
+        self.command = command
+        self.chat_json = chat_json
+        self.future: Future = get_running_loop().create_future()
+        self.queued_time = monotonic()
+
+
+class RCONDispatcher:
+    """
+    Queues RCON commands and flushes everything issued within 'batch_window' seconds as one
+    pipelined batch, keeping commands in order per destination. Relayed chat lines waiting in
+    the same window are merged into a single tellraw, and are dropped rather than queued once
+    the queue is full. Other commands wait for space instead (backpressure).
+
+    Commands that mustn't share a fate with unrelated traffic (purchases) are queued with
+    'put_isolated' instead. Each such group is flushed on its own after the shared batch, one
+    command at a time, and stops at the first failure so the rest are known not to have run.
+    """
+
+    def __init__(
+        self,
+        client: AsyncRCONClient,
+        batch_window: float = 0.05,
+        max_queue_size: int = 256,
+    ):
+        self.client = client
+        self.batch_window = batch_window
+        self.max_queue_size = max_queue_size
+
+        self.queues: Dict[str, Deque[QueuedCommand]] = {}
+        self.isolated_batches: Deque[List[QueuedCommand]] = deque()
+        self.queue_size = 0
+        self.wakeup = Event()
+        self.space_available = Event()
+        self.space_available.set()
+        self.worker: Optional[Task] = None
+        self.in_flight: List[QueuedCommand] = []
+
+        # Metrics
+        self.max_queue_depth = 0
+        self.batches_flushed = 0
+        self.commands_sent = 0
+        self.chat_merged = 0
+        self.chat_dropped = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.last_queue_wait = 0.0
+
+    def _start(self):
+        if self.worker is None or self.worker.done():
+            self.worker = create_task(self._run())
+
+    def _enqueue(self, destination: str, queued: QueuedCommand):
+        self.queues.setdefault(destination, deque()).append(queued)
+        self._queued(1)
+
+    def _queued(self, count: int):
+        self.queue_size += count
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_size)
+        if self.queue_size >= self.max_queue_size:
+            self.space_available.clear()
+        self.wakeup.set()
+
+    def _dequeued(self, count: int):
+        self.queue_size -= count
+        if self.queue_size < self.max_queue_size:
+            self.space_available.set()
+
+    async def put(self, command: str, destination: str = "default") -> Future:
+        """
+        Queues a command, waiting while the queue is full. Returns a future for its response.
+        """
+        self._start()
+        while self.queue_size >= self.max_queue_size:
+            await self.space_available.wait()
+        queued = QueuedCommand(command)
+        self._enqueue(destination, queued)
+        return queued.future
+
+    async def put_isolated(self, commands: List[str]) -> List[Future]:
+        """
+        Queues commands to be flushed as their own batch, in order, waiting while the queue is
+        full. Returns a future for each response.
+        """
+        self._start()
+        while self.queue_size >= self.max_queue_size:
+            await self.space_available.wait()
+        batch = [QueuedCommand(command) for command in commands]
+        self.isolated_batches.append(batch)
+        self._queued(len(batch))
+        return [queued.future for queued in batch]
+
+    async def send_chat(self, chat_json: str) -> bool:
+        """
+        Sends a tellraw (components as a JSON array) to every player, merged with any chat still
+        waiting to be flushed. Returns False if it couldn't be delivered or was dropped.
+        """
+        self._start()
+        pending_chat = self.queues.get(CHAT_DESTINATION)
+        if pending_chat:
+            last = pending_chat[-1]
+            merged_json = join_json_arrays(last.chat_json, CHAT_LINE_BREAK, chat_json)
+            merged_command = f"tellraw @a {merged_json}"
+            if len(merged_command.encode("utf-8")) <= MAX_COMMAND_LENGTH:
+                last.chat_json = merged_json
+                last.command = merged_command
+                self.chat_merged += 1
+                return await self._chat_result(last.future)
+
+        if self.queue_size >= self.max_queue_size:
+            self.chat_dropped += 1
+            return False
+        queued = QueuedCommand(f"tellraw @a {chat_json}", chat_json)
+        self._enqueue(CHAT_DESTINATION, queued)
+        return await self._chat_result(queued.future)
+
+    @staticmethod
+    async def _chat_result(future: Future) -> bool:
+        try:
+            await future
+        except Exception:
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            await sleep(self.batch_window)
+            self.wakeup.clear()
+
+            batch: List[QueuedCommand] = []
+            for queue in self.queues.values():
+                batch.extend(queue)
+            self.queues = {}
+            self._dequeued(len(batch))
+            if batch:
+                self.in_flight = batch
+                await self._flush(batch)
+            while self.isolated_batches:
+                self.in_flight = self.isolated_batches.popleft()
+                self._dequeued(len(self.in_flight))
+                await self._flush_in_sequence(self.in_flight)
+            self.in_flight = []
+
+    async def _flush(self, batch: List[QueuedCommand]):
+        start_time = monotonic()
+        self.last_queue_wait = start_time - min(queued.queued_time for queued in batch)
+        try:
+            await self.client.connect()
+            # Every command is written before any response is awaited, in batch order
+            results = await gather(
+                *(self.client.command(queued.command) for queued in batch),
+                return_exceptions=True,
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for queued, result in zip(batch, results):
+            if queued.future.done():
+                continue
+            if isinstance(result, BaseException):
+                queued.future.set_exception(result)
+            else:
+                queued.future.set_result(result)
+        self._record_flush(batch, start_time)
+
+    async def _flush_in_sequence(self, batch: List[QueuedCommand]):
+        start_time = monotonic()
+        self.last_queue_wait = start_time - batch[0].queued_time
+        for index, queued in enumerate(batch):
+            try:
+                response = await self.client.command(queued.command)
+            except Exception as e:
+                queued.future.set_exception(e)
+                for skipped in batch[index + 1 :]:
+                    skipped.future.set_exception(
+                        RCONError("Not sent, an earlier command in its batch failed")
+                    )
+                break
+            queued.future.set_result(response)
+        self._record_flush(batch, start_time)
+
+    def _record_flush(self, batch: List[QueuedCommand], start_time: float):
+        self.last_flush_latency = monotonic() - start_time
+        self.total_flush_latency += self.last_flush_latency
+        self.batches_flushed += 1
+        self.commands_sent += len(batch)
+
+    async def close(self):
+        """
+        Stops the worker and fails every command it hadn't answered yet, so no caller is left
+        waiting on a response that will never come.
+        """
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        unanswered = list(self.in_flight)
+        for queue in self.queues.values():
+            unanswered.extend(queue)
+        for isolated_batch in self.isolated_batches:
+            unanswered.extend(isolated_batch)
+        self.in_flight, self.queues, self.queue_size = [], {}, 0
+        self.isolated_batches = deque()
+        self.space_available.set()
+        for queued in unanswered:
+            if not queued.future.done():
+                queued.future.set_exception(RCONError("RCON dispatcher closed"))
+
+    def stats(self) -> str:
+        average_flush_latency = (
+            self.total_flush_latency / self.batches_flushed
+            if self.batches_flushed
+            else 0.0
+        )
+        return (
+            f"queue depth {self.queue_size}/{self.max_queue_size} (max {self.max_queue_depth}), "
+            f"{self.commands_sent} commands in {self.batches_flushed} batches, "
+            f"flush latency {self.last_flush_latency * 1000:.1f}ms "
+            f"(avg {average_flush_latency * 1000:.1f}ms), "
+            f"last queue wait {self.last_queue_wait * 1000:.1f}ms, "
+            f"{self.chat_merged} chat lines merged, {self.chat_dropped} dropped"
+        )
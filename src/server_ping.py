@@ -0,0 +1,130 @@
+import json
+from asyncio import StreamReader
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import open_connection, wait_for
+from collections import deque
+from struct import pack
+from time import monotonic, perf_counter, time
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+PROTOCOL_VERSION = 47  # Any version works for a status request
+NEXT_STATE_STATUS = 1
+
+
+class StatusSample(NamedTuple):
+    timestamp: float
+    online: bool
+    players_online: int
+    players_max: int
+    latency: float  # Seconds, 0 while offline
+
+
+def encode_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFF
+    encoded = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded += bytes([byte | 0x80])
+        else:
+            return encoded + bytes([byte])
+
+
+async def read_varint(reader: StreamReader) -> int:
+    value = 0
+    for position in range(5):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * position)
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt is too big")
+
+
+def encode_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def ping_server(host: str, port: int = 25565) -> Dict[str, Any]:
+    """
+    Does a Server List Ping and returns the server's status response.
+    """
+    reader, writer = await open_connection(host, port)
+    try:
+        encoded_host = host.encode("utf-8")
+        handshake = (
+            encode_varint(PROTOCOL_VERSION)
+            + encode_varint(len(encoded_host))
+            + encoded_host
+            + pack(">H", port)
+            + encode_varint(NEXT_STATE_STATUS)
+        )
+        writer.write(encode_packet(0x00, handshake) + encode_packet(0x00))
+        await writer.drain()
+
+        await read_varint(reader)  # Packet length
+        if await read_varint(reader) != 0x00:
+            raise ValueError("Unexpected Server List Ping response")
+        response_length = await read_varint(reader)
+        return json.loads(await reader.readexactly(response_length))
+    finally:
+        writer.close()
+
+
+class ServerStatusPoller:
+    """
+    Polls the server's status without blocking the event loop, keeping the most recent samples
+    in a fixed-size ring buffer so status history can be read without pinging again. While the
+    server is offline, polls back off exponentially up to 'max_backoff' seconds.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 25565,
+        timeout: float = 3.0,
+        history_size: int = 360,
+        max_backoff: float = 120.0,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.history: Deque[StatusSample] = deque(maxlen=history_size)
+        self.backoff = 0.0
+        self.next_poll_time = 0.0
+
+    @property
+    def latest(self) -> Optional[StatusSample]:
+        return self.history[-1] if self.history else None
+
+    async def poll(self) -> Optional[StatusSample]:
+        """
+        Pings the server and records a sample, or returns None while still backing off.
+        """
+        if monotonic() < self.next_poll_time:
+            return None
+
+        start_time = perf_counter()
+        try:
+            stats = await wait_for(ping_server(self.host, self.port), self.timeout)
+        except (OSError, AsyncTimeoutError, EOFError):  # Offline or unreachable
+            self.backoff = min(max(self.backoff * 2, 10.0), self.max_backoff)
+            self.next_poll_time = monotonic() + self.backoff
+            sample = StatusSample(time(), False, 0, 0, 0.0)
+            self.history.append(sample)
+            return sample
+
+        self.backoff = 0.0
+        self.next_poll_time = 0.0
+        players = stats.get("players", {})
+        sample = StatusSample(
+            time(),
+            True,
+            int(players.get("online", 0)),
+            int(players.get("max", 0)),
+            perf_counter() - start_time,
+        )
+        self.history.append(sample)
+        return sample
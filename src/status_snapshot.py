@@ -0,0 +1,151 @@
+import mmap
+import os
+from pathlib import Path
+from struct import Struct
+from time import time
+from typing import Any, Dict, Optional
+
+STATUS_SNAPSHOT_PATH = Path("data") / "status_snapshot.bin"
+SNAPSHOT_MAGIC = b"LRS1"  # Bumped whenever the layout changes
+MAX_STATUS_TEXT_BYTES = 64
+
+# Sequence counter first, odd while the writer is mid-update
+SEQUENCE = Struct("<Q")
+SNAPSHOT = Struct(f"<4s?xxxIIIdddd{MAX_STATUS_TEXT_BYTES}s")
+SNAPSHOT_FIELDS = (
+    "magic",
+    "server_online",
+    "players_online",
+    "players_max",
+    "linked_players",
+    "donation_total",
+    "server_status_time",
+    "donation_time",
+    "linked_players_time",
+    "server_status",
+)
+SNAPSHOT_SIZE = SEQUENCE.size + SNAPSHOT.size
+READ_ATTEMPTS = 1000
+
+
+def decode_status_text(status_text: bytes) -> str:
+    return status_text.rstrip(b"\0").decode("utf-8", "ignore")
+
+
+class StatusSnapshotWriter:
+    """
+    Publishes the bot's view of the server, donations and links to a fixed-layout
+    memory-mapped file for the webserver workers. There is only ever one writer (the bot), so
+    a sequence counter (seqlock) is enough for readers to get a consistent snapshot without
+    any locking. The file is created on the first publish.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.mapping: Optional[mmap.mmap] = None
+        self.values: Dict[str, Any] = {
+            "server_online": False,
+            "players_online": 0,
+            "players_max": 0,
+            "linked_players": 0,
+            "donation_total": 0.0,
+            "server_status_time": 0.0,
+            "donation_time": 0.0,
+            "linked_players_time": 0.0,
+            "server_status": "",
+        }
+        self.sequence = 0
+
+    def _open(self) -> mmap.mmap:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Reused (never replaced) across restarts, so readers' existing mappings stay valid
+        snapshot_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(snapshot_fd).st_size != SNAPSHOT_SIZE:
+                os.ftruncate(snapshot_fd, SNAPSHOT_SIZE)
+            mapping = mmap.mmap(snapshot_fd, SNAPSHOT_SIZE)
+        finally:
+            os.close(snapshot_fd)
+        (sequence,) = SEQUENCE.unpack_from(mapping, 0)
+        self.sequence = sequence + (sequence & 1)  # Left odd by a crash mid-update
+        # Keep what the last run published until it's updated again
+        values = SNAPSHOT.unpack_from(mapping, SEQUENCE.size)
+        if values[0] == SNAPSHOT_MAGIC:
+            self.values.update(zip(SNAPSHOT_FIELDS[1:], values[1:]))
+            self.values["server_status"] = decode_status_text(values[-1])
+        return mapping
+
+    def update_server_status(
+        self, online: bool, players_online: int, players_max: int, status: str
+    ):
+        self.publish(
+            server_online=online,
+            players_online=players_online,
+            players_max=players_max,
+            server_status=status,
+            server_status_time=time(),
+        )
+
+    def update_donation_total(self, total: float):
+        self.publish(donation_total=total, donation_time=time())
+
+    def update_linked_players(self, count: int):
+        self.publish(linked_players=count, linked_players_time=time())
+
+    def publish(self, **changes: Any):
+        if self.mapping is None:
+            self.mapping = self._open()
+        self.values.update(changes)
+        status_text = self.values["server_status"].encode("utf-8")
+        packed = SNAPSHOT.pack(
+            SNAPSHOT_MAGIC,
+            *(self.values[field] for field in SNAPSHOT_FIELDS[1:-1]),
+            status_text[:MAX_STATUS_TEXT_BYTES],
+        )
+        SEQUENCE.pack_into(self.mapping, 0, self.sequence + 1)
+        self.mapping[SEQUENCE.size : SNAPSHOT_SIZE] = packed
+        self.sequence += 2
+        SEQUENCE.pack_into(self.mapping, 0, self.sequence)
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+class StatusSnapshotReader:
+    """
+    Reads the snapshot published by StatusSnapshotWriter straight from the shared mapping,
+    retrying if it was read while the writer was mid-update.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.mapping: Optional[mmap.mmap] = None
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the latest consistent snapshot, or None if the bot hasn't published one yet.
+        """
+        if self.mapping is None:
+            try:
+                with open(self.path, "rb") as snapshot_file:
+                    self.mapping = mmap.mmap(
+                        snapshot_file.fileno(), SNAPSHOT_SIZE, access=mmap.ACCESS_READ
+                    )
+            except (FileNotFoundError, ValueError):  # Missing, or not yet sized
+                return None
+
+        for _ in range(READ_ATTEMPTS):
+            (sequence,) = SEQUENCE.unpack_from(self.mapping, 0)
+            if sequence & 1:
+                continue
+            values = SNAPSHOT.unpack_from(self.mapping, SEQUENCE.size)
+            if SEQUENCE.unpack_from(self.mapping, 0)[0] != sequence:
+                continue
+            if sequence == 0 or values[0] != SNAPSHOT_MAGIC:
+                return None
+            snapshot = dict(zip(SNAPSHOT_FIELDS[1:], values[1:]))
+            snapshot["server_status"] = decode_status_text(values[-1])
+            return snapshot
+        return None
@@ -0,0 +1,147 @@
+import json
+import sqlite3
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+STATUS_PENDING = "pending"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+class TransactionQueue:
+    """
+    Durable queue of Store purchases in a local SQLite database, keyed by transaction id so a
+    purchase delivered twice is only queued once. Completed stages are stored separately, so
+    after a crash or restart a purchase resumes from the first stage that hadn't finished.
+    A stage that was interrupted mid-way runs again, so delivery is at-least-once per stage.
+    """
+
+    def __init__(self, database_path: Path):
+        database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(database_path), isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                received_time REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_time REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS transactions_pending
+                ON transactions (status, next_attempt_time);
+            CREATE TABLE IF NOT EXISTS completed_stages (
+                transaction_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                completed_time REAL NOT NULL,
+                PRIMARY KEY (transaction_id, stage)
+            );
+            """
+        )
+
+    def add(self, transaction_id: str, transaction: Dict[str, Any]) -> bool:
+        """
+        Queues a purchase, returns False if this transaction id was already queued.
+        """
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO transactions (transaction_id, payload, status, received_time)"
+            " VALUES (?, ?, ?, ?)",
+            (transaction_id, json.dumps(transaction), STATUS_PENDING, time()),
+        )
+        return cursor.rowcount == 1
+
+    def next_due(
+        self, current_time: float
+    ) -> Optional[Tuple[str, Dict[str, Any], int, Set[str]]]:
+        """
+        Returns the oldest pending purchase that is due, with how many attempts it has failed
+        and the stages it already completed.
+        """
+        row = self.connection.execute(
+            "SELECT transaction_id, payload, attempts FROM transactions"
+            " WHERE status = ? AND next_attempt_time <= ?"
+            " ORDER BY received_time LIMIT 1",
+            (STATUS_PENDING, current_time),
+        ).fetchone()
+        if row is None:
+            return None
+        transaction_id, payload, attempts = row
+        completed = {
+            stage
+            for (stage,) in self.connection.execute(
+                "SELECT stage FROM completed_stages WHERE transaction_id = ?",
+                (transaction_id,),
+            )
+        }
+        return transaction_id, json.loads(payload), attempts, completed
+
+    def next_attempt_time(self) -> Optional[float]:
+        (next_time,) = self.connection.execute(
+            "SELECT MIN(next_attempt_time) FROM transactions WHERE status = ?",
+            (STATUS_PENDING,),
+        ).fetchone()
+        return next_time
+
+    def complete_stage(self, transaction_id: str, stage: str):
+        self.connection.execute(
+            "INSERT OR IGNORE INTO completed_stages (transaction_id, stage, completed_time)"
+            " VALUES (?, ?, ?)",
+            (transaction_id, stage, time()),
+        )
+
+    def complete(self, transaction_id: str):
+        self._set_status(transaction_id, STATUS_COMPLETED)
+
+    def retry_later(self, transaction_id: str, error: str, delay: float):
+        self._record_failure(transaction_id, error, STATUS_PENDING, time() + delay)
+
+    def fail(self, transaction_id: str, error: str):
+        """
+        Gives up on a purchase until it's requeued with 'requeue_failed'.
+        """
+        self._record_failure(transaction_id, error, STATUS_FAILED, 0)
+
+    def _record_failure(
+        self, transaction_id: str, error: str, status: str, next_attempt_time: float
+    ):
+        self.connection.execute(
+            "UPDATE transactions SET status = ?, attempts = attempts + 1,"
+            " next_attempt_time = ?, last_error = ? WHERE transaction_id = ?",
+            (status, next_attempt_time, error, transaction_id),
+        )
+
+    def requeue_failed(self) -> int:
+        """
+        Gives every failed purchase a fresh set of attempts, returns how many were requeued.
+        """
+        cursor = self.connection.execute(
+            "UPDATE transactions SET status = ?, attempts = 0, next_attempt_time = 0"
+            " WHERE status = ?",
+            (STATUS_PENDING, STATUS_FAILED),
+        )
+        return cursor.rowcount
+
+    def _set_status(self, transaction_id: str, status: str):
+        self.connection.execute(
+            "UPDATE transactions SET status = ? WHERE transaction_id = ?",
+            (status, transaction_id),
+        )
+
+    def stats(self) -> str:
+        counts = dict(
+            self.connection.execute(
+                "SELECT status, COUNT(*) FROM transactions GROUP BY status"
+            ).fetchall()
+        )
+        return ", ".join(
+            f"{counts.get(status, 0)} {status}"
+            for status in (STATUS_PENDING, STATUS_FAILED, STATUS_COMPLETED)
+        )
+
+    def close(self):
+        self.connection.close()
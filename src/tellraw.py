@@ -0,0 +1,117 @@
+import json
+import re
+from typing import Any, Dict, List
+
+from utils import LRUCache
+
+COLORS = {
+    "0": "black",
+    "1": "dark_blue",
+    "2": "dark_green",
+    "3": "dark_aqua",
+    "4": "dark_red",
+    "5": "dark_purple",
+    "6": "gold",
+    "7": "gray",
+    "8": "dark_gray",
+    "9": "blue",
+    "a": "green",
+    "b": "aqua",
+    "c": "red",
+    "d": "light_purple",
+    "e": "yellow",
+    "f": "white",
+}
+FORMATS = {
+    "l": "bold",
+    "m": "strikethrough",
+    "n": "underline",
+    "o": "italic",
+}
+RESET = "r"
+FORMAT_BITS = {code: 1 << index for index, code in enumerate(FORMATS)}
+FORMAT_BITS[RESET] = 0
+# Every combination of active formats, as the flags a component starts with
+FORMAT_FLAGS = [
+    {name: True for code, name in FORMATS.items() if mask & FORMAT_BITS[code]}
+    for mask in range(1 << len(FORMATS))
+]
+
+CLEAN_FORMATTING_REGEX = re.compile(r"§[a-zA-Z0-9]")
+
+nickname_json_cache = LRUCache(1024)
+
+
+def strip_formatting(text: str) -> str:
+    return CLEAN_FORMATTING_REGEX.sub("", text)
+
+
+def format_nickname(text: str) -> List[Dict[str, Any]]:
+    """
+    Converts a '§'-coded Minecraft name into tellraw text components.
+    """
+    components: List[Dict[str, Any]] = []
+    format_mask = 0
+    component: Dict[str, Any] = {}
+
+    pieces = text.split("§")
+    pending_text = pieces[0]
+    for piece in pieces[1:]:
+        if not piece:
+            continue  # A run of '§' primes the character after the last one
+        code = piece[0]
+        color = COLORS.get(code)
+        if color is None and code not in FORMAT_BITS:
+            # Unknown codes are dropped without splitting the text
+            pending_text += piece[1:]
+            continue
+
+        if pending_text:
+            component["text"] = pending_text
+            components.append(component)
+        pending_text = piece[1:]
+        if color is not None:
+            component = dict(FORMAT_FLAGS[format_mask])
+            component["color"] = color
+            continue
+        if code == RESET:
+            # A reset also strips the color from the text it ends, as it always has
+            component.pop("color", None)
+            format_mask = 0
+        else:
+            format_mask |= FORMAT_BITS[code]
+        component = dict(
+            FORMAT_FLAGS[format_mask]
+        )  # Formatting codes also clear the color
+
+    if pending_text:
+        component["text"] = pending_text
+        components.append(component)
+
+    return components
+
+
+def nickname_json(display_name: str) -> str:
+    """
+    Returns the tellraw components for a player's display name as a JSON array, memoized since
+    the same few names are relayed over and over.
+    """
+    cached = nickname_json_cache.get(display_name)
+    if cached is not None:
+        return cached
+
+    if strip_formatting(display_name) == display_name:
+        components = [{"text": display_name, "color": "gray"}]
+    else:
+        components = format_nickname(display_name)
+    encoded = json.dumps(components)
+    nickname_json_cache.put(display_name, encoded)
+    return encoded
+
+
+def join_json_arrays(*json_arrays: str) -> str:
+    """
+    Concatenates already serialized JSON arrays without parsing them again.
+    """
+    items = [json_array[1:-1] for json_array in json_arrays if json_array != "[]"]
+    return f"[{', '.join(items)}]"
@@ -1,9 +1,12 @@
 import logging
 from argparse import ArgumentParser
+from collections import OrderedDict
 from datetime import datetime
 from json import load as load_json
 from math import floor
-from typing import Any, Dict, List, TextIO, Tuple, Union
+from pathlib import Path
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Optional, TextIO, Tuple, Union
 
 from discord import Guild as DiscordGuild
 from discord import Intents as DiscordIntents
@@ -16,6 +19,8 @@ from discord import Webhook as DiscordWebhook
 from discord.ext.commands import Bot as DiscordBot
 from pytz import timezone
 
+from status_snapshot import STATUS_SNAPSHOT_PATH, StatusSnapshotWriter
+
 
 class BotClass:
     def __init__(self):
@@ -37,13 +42,86 @@ class BotClass:
         self.logger.addHandler(self.handler)
 
         self.CFG: Dict[Any, Any] = {}
+        self.config_path = "config.json"
         self.guild = DiscordGuild
         self.channels: Dict[str, DiscordChannel] = {}
         self.roles: Dict[str, DiscordRole] = {}
         self.ready = False
+        # Shared with the webserver workers, see status_snapshot.py
+        self.status_snapshot = StatusSnapshotWriter(Path.cwd() / STATUS_SNAPSHOT_PATH)
         do_log("Initialized Discord Client")
 
 
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache, counting hits and misses so its effectiveness can be
+    checked while the bot is running.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(int(max_size), 0)
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the cached value for 'key' (marking it as recently used), or None if not cached.
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size == 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (
+            f"{len(self.entries)}/{self.max_size} entries, {self.hits} hits, "
+            f"{self.misses} misses ({hit_rate:.1f}% hit rate)"
+        )
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries also expire, each after its own time-to-live in seconds.
+    """
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expiry_time, value = entry
+        if monotonic() >= expiry_time:
+            del self.entries[key]
+            self.hits -= 1
+            self.misses += 1
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: float = 60.0):
+        if ttl > 0:
+            super().put(key, (monotonic() + ttl, value))
+
+
 def censor_text(text: str, leave_uncensored: int = 4) -> str:
     """
     Censors the second half (excluding the last 'leave_uncensored' number of letters) for the
@@ -280,6 +358,7 @@ def load_config_to_bot(bot_instance: BotClass) -> BotClass:
             loaded_config = json_load_eval(config_file)
     except FileNotFoundError:
         raise FileNotFoundError(f"'{args.config}' not found.")
+    bot_instance.config_path = args.config
     for config_key in loaded_config:
         loaded_val = loaded_config[config_key]
         bot_instance.CFG[config_key] = loaded_val
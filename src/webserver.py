@@ -1,30 +1,195 @@
-from datetime import datetime
+import logging
+from asyncio import Queue, Task
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import create_task, shield, sleep, wait_for
 from os import getenv
 from pathlib import Path
+from time import monotonic
+from typing import AsyncIterator, Optional, Set, Tuple
 
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from donation_ledger import DONATIONS_DATABASE_PATH, DonationLedger, current_month
+from status_snapshot import STATUS_SNAPSHOT_PATH, StatusSnapshotReader
 
 load_dotenv(verbose=True)
 app = FastAPI()
+# Configured by uvicorn, and by gunicorn through its uvicorn workers
+logger = logging.getLogger("uvicorn.error")
+# Read-only, the bot is the only writer
+donation_ledger = DonationLedger(Path.cwd() / DONATIONS_DATABASE_PATH, read_only=True)
+# Published by the bot, read without ever contacting the Minecraft server
+status_snapshot = StatusSnapshotReader(Path.cwd() / STATUS_SNAPSHOT_PATH)
+PUBLIC_STATUS_FIELDS = (
+    "server_online",
+    "server_status",
+    "players_online",
+    "players_max",
+    "server_status_time",
+    "linked_players",
+    "linked_players_time",
+)
+# How long browsers may reuse a response before revalidating it with its ETag
+DONATIONS_CACHE_SECONDS = int(getenv("DONATIONS_CACHE_SECONDS", 10))
+# Sent on idle streams so proxies don't time them out
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+class DonationProgress:
+    """
+    The current month's goal percentage, served from memory. The ledger is only queried again
+    when its files have changed (checked at most every 'check_interval' seconds), the month
+    has rolled over or the goal has changed.
+    """
+
+    def __init__(self, ledger: DonationLedger, check_interval: float = 1.0):
+        self.ledger = ledger
+        self.check_interval = check_interval
+        self.next_check_time = 0.0
+        self.signature: Optional[Tuple] = None
+        self.percentage = 0
+        self.etag = '"0"'
+        # Concurrent requests during a check all wait on the same one (single-flight)
+        self.refresh_task: Optional[Task] = None
+
+    async def get(self) -> Tuple[int, str]:
+        if self.signature is not None and monotonic() < self.next_check_time:
+            return self.percentage, self.etag
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = create_task(self._refresh())
+        # Shielded so a cancelled request doesn't cancel the check the others are waiting on
+        return await shield(self.refresh_task)
+
+    async def _refresh(self) -> Tuple[int, str]:
+        goal = int(getenv("DONATIONS_GOAL", 100))
+        signature = (current_month(), goal, self.ledger.change_signature())
+        if signature != self.signature:
+            current_income = await run_in_threadpool(self.ledger.monthly_total)
+            self.percentage = round((current_income / goal) * 100)
+            self.etag = f'"{self.percentage}"'
+            self.signature = signature
+        self.next_check_time = monotonic() + self.check_interval
+        return self.percentage, self.etag
+
+
+class DonationProgressBroadcaster:
+    """
+    Pushes the goal percentage to every open stream in this worker when it changes. A single
+    poll loop watches the ledger however many streams are open, and only runs while there are
+    any. Each subscriber's queue holds just the latest value it hasn't been sent yet, so a
+    slow client never buffers more than one update.
+    """
+
+    def __init__(self, progress: DonationProgress, poll_interval: float = 1.0):
+        self.progress = progress
+        self.poll_interval = poll_interval
+        self.subscribers: Set[Queue] = set()
+        self.poller: Optional[Task] = None
+        self.last_percentage = 0
+
+    async def subscribe(self) -> Tuple[Queue, int]:
+        """
+        Returns the subscriber's queue and the current percentage to send it first.
+        """
+        percentage, _ = await self.progress.get()
+        queue: Queue = Queue(maxsize=1)
+        self.subscribers.add(queue)
+        if self.poller is None or self.poller.done():
+            # Changes are looked for from the value this first subscriber is sent
+            self.last_percentage = percentage
+            self.poller = create_task(self._poll())
+        return queue, percentage
+
+    def unsubscribe(self, queue: Queue):
+        self.subscribers.discard(queue)
+
+    async def _poll(self):
+        while self.subscribers:
+            await sleep(self.poll_interval)
+            try:
+                percentage, _ = await self.progress.get()
+            except Exception:
+                # Keep polling, or every subscriber would wait forever for their next update
+                logger.exception("Could not read the donation progress")
+                continue
+            if percentage == self.last_percentage:
+                continue
+            self.last_percentage = percentage
+            for queue in self.subscribers:
+                if queue.full():
+                    queue.get_nowait()  # Replace the update they haven't been sent yet
+                queue.put_nowait(percentage)
+
+
+donation_progress = DonationProgress(donation_ledger)
+donation_broadcaster = DonationProgressBroadcaster(donation_progress)
 
 
 @app.get("/donations/{donations_token}")
-def update_item(donations_token: str):
+async def update_item(donations_token: str, request: Request):
     if donations_token != getenv("DONATIONS_TOKEN"):
         return 0  # TODO: Make a competent security system
 
-    path = Path.cwd() / "data" / "monthly_progress"
-    current_goal_month = f"{datetime.now().strftime('%Y-%m')}.dat"
-    current_income = 0.0
+    percentage, etag = await donation_progress.get()
+    headers = {"ETag": etag, "Cache-Control": f"max-age={DONATIONS_CACHE_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(percentage, headers=headers)
+
 
+async def donation_progress_events() -> AsyncIterator[str]:
+    queue, percentage = await donation_broadcaster.subscribe()
     try:
-        with open(path / current_goal_month, "r") as data_file:
-            current_income = float(data_file.read())
-    except FileNotFoundError:
-        Path(path).mkdir(exist_ok=True)
-        with open(path / current_goal_month, "w") as data_file:
-            data_file.write(str(current_income))
-    percentage = round((current_income / int(getenv("DONATIONS_GOAL", 100))) * 100)
-
-    return percentage
+        yield f"retry: 5000\ndata: {percentage}\n\n"
+        while True:
+            try:
+                percentage = await wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                yield f"data: {percentage}\n\n"
+            except AsyncTimeoutError:
+                yield ": heartbeat\n\n"
+    finally:
+        # Also reached when the client disconnects and the stream is cancelled
+        donation_broadcaster.unsubscribe(queue)
+
+
+@app.get("/donations/{donations_token}/stream")
+async def stream_donation_progress(donations_token: str):
+    """
+    Server-Sent Events stream of the goal percentage, sent on connect and whenever it changes.
+    """
+    if donations_token != getenv("DONATIONS_TOKEN"):
+        return 0
+
+    return StreamingResponse(
+        donation_progress_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/status")
+async def server_status():
+    """
+    The server status and linked player count last published by the bot.
+    """
+    snapshot = status_snapshot.read()
+    if snapshot is None:
+        return JSONResponse({}, status_code=503)
+    return {field: snapshot[field] for field in PUBLIC_STATUS_FIELDS}
+
+
+@app.get("/status/{donations_token}")
+async def full_status(donations_token: str):
+    """
+    Everything the bot publishes, including this month's donation total.
+    """
+    if donations_token != getenv("DONATIONS_TOKEN"):
+        return 0
+
+    snapshot = status_snapshot.read()
+    if snapshot is None:
+        return JSONResponse({}, status_code=503)
+    return snapshot
@@ -0,0 +1,290 @@
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from unicodedata import combining
+from unicodedata import normalize as unicode_normalize
+
+STARTSWITH = 1
+INSIDE_WORDS = 2
+INDEPENDENT = 4
+
+# Lookalike letters that NFKD decomposition doesn't already fold to ASCII
+CONFUSABLES = {
+    # Cyrillic
+    "а": "a",
+    "в": "b",
+    "ь": "b",
+    "с": "c",
+    "ԁ": "d",
+    "е": "e",
+    "ё": "e",
+    "г": "r",
+    "һ": "h",
+    "н": "h",
+    "і": "i",
+    "ї": "i",
+    "ӏ": "l",
+    "ј": "j",
+    "к": "k",
+    "м": "m",
+    "п": "n",
+    "о": "o",
+    "р": "p",
+    "ԛ": "q",
+    "ѕ": "s",
+    "т": "t",
+    "у": "y",
+    "ԝ": "w",
+    "х": "x",
+    # Greek
+    "α": "a",
+    "β": "b",
+    "ϲ": "c",
+    "ε": "e",
+    "η": "n",
+    "ι": "i",
+    "κ": "k",
+    "ν": "v",
+    "ο": "o",
+    "ρ": "p",
+    "τ": "t",
+    "υ": "u",
+    "χ": "x",
+    "ω": "w",
+    # Latin letters without a decomposition
+    "ɑ": "a",
+    "ɡ": "g",
+    "ı": "i",
+    "ɩ": "i",
+    "ł": "l",
+    "ø": "o",
+    "đ": "d",
+    "ħ": "h",
+    "ƒ": "f",
+    "æ": "ae",
+    "œ": "oe",
+}
+ALLOWED_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+MAX_CACHED_CHARACTERS = 8192
+
+
+class _TranslationTable(Dict[int, Optional[str]]):
+    """
+    'str.translate' table that folds each character the first time it's seen and remembers it.
+    """
+
+    def __init__(self, normalizer: "TextNormalizer"):
+        super().__init__()
+        self.normalizer = normalizer
+
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        folded = self.normalizer.fold_character(chr(codepoint))
+        if len(self) < MAX_CACHED_CHARACTERS:
+            self[codepoint] = folded
+        return folded
+
+
+class WordMatcher:
+    """
+    Aho-Corasick automaton over every censored term, so a message can be checked against all
+    three censor match modes (start of a word, anywhere inside a word, whole word) in a single
+    pass over its text. Words are delimited by spaces, mirroring 'text.split(" ")'.
+    """
+
+    def __init__(
+        self,
+        words_startswith: Iterable[str],
+        words_inside_words: Iterable[str],
+        words_independent: Iterable[str],
+    ):
+        # An empty startswith/inside term matches every message, an empty independent term
+        # matches any empty word (leading, trailing or doubled spaces)
+        self.always_match = False
+        self.match_empty_word = False
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[Dict[int, int]] = [{}]  # Term length -> match mode flags
+
+        for words, mode in (
+            (words_startswith, STARTSWITH),
+            (words_inside_words, INSIDE_WORDS),
+            (words_independent, INDEPENDENT),
+        ):
+            for word in words:
+                self._add_word(str(word), mode)
+        self._build_failure_links()
+
+        # Flattened for the hot loop; nodes without any output are skipped cheaply
+        self._node_outputs: List[Tuple[Tuple[int, int], ...]] = [
+            tuple(outputs.items()) for outputs in self._outputs
+        ]
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _add_word(self, word: str, mode: int):
+        if word == "":
+            if mode == INDEPENDENT:
+                self.match_empty_word = True
+            else:
+                self.always_match = True
+            return
+        if " " in word:
+            return  # Words never contain spaces, so this term can never match
+
+        node = 0
+        for character in word:
+            next_node = self._goto[node].get(character)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][character] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append({})
+            node = next_node
+        outputs = self._outputs[node]
+        outputs[len(word)] = outputs.get(len(word), 0) | mode
+
+    def _build_failure_links(self):
+        queue: Deque[int] = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and character not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                child_fail = self._goto[fallback].get(character, 0)
+                self._fail[child] = child_fail if child_fail != child else 0
+
+                # Inherit the terms that end on the failure node (suffixes of this node)
+                outputs = self._outputs[child]
+                for length, mode in self._outputs[self._fail[child]].items():
+                    outputs[length] = outputs.get(length, 0) | mode
+
+    def matches(self, text: str) -> bool:
+        """
+        Returns True if any censored term matches 'text' under its match mode.
+        """
+        if self.always_match:
+            return True
+        if self.match_empty_word and (
+            text == "" or text[0] == " " or text[-1] == " " or "  " in text
+        ):
+            return True
+
+        goto = self._goto
+        fail = self._fail
+        node_outputs = self._node_outputs
+        last_index = len(text) - 1
+        node = 0
+        word_start = 0
+        for index, character in enumerate(text):
+            if character == " ":
+                node = 0
+                word_start = index + 1
+                continue
+
+            transitions = goto[node]
+            while node and character not in transitions:
+                node = fail[node]
+                transitions = goto[node]
+            node = transitions.get(character, 0)
+
+            outputs = node_outputs[node]
+            if not outputs:
+                continue
+            for length, mode in outputs:
+                if mode & INSIDE_WORDS:
+                    return True
+                if index - length + 1 != word_start:
+                    continue
+                if mode & STARTSWITH:
+                    return True
+                if mode & INDEPENDENT and (
+                    index == last_index or text[index + 1] == " "
+                ):
+                    return True
+        return False
+
+
+class TextNormalizer:
+    """
+    Folds text before censor matching in a single 'str.translate' pass: case folding, the
+    configured letter replacements, bundled Unicode confusables (and NFKD compatibility forms,
+    i.e. fullwidth or stylized letters), and stripping of anything that isn't an ASCII letter,
+    digit or whitespace.
+    """
+
+    def __init__(self, letter_replacements: Dict[Any, Any]):
+        self.letter_replacements: Dict[str, str] = {}
+        self.multi_character_replacements: List[Tuple[str, str]] = []
+        for bypass_letter, original_letter in letter_replacements.items():
+            bypass_letter, original_letter = str(bypass_letter), str(original_letter)
+            if len(bypass_letter) == 1:
+                self.letter_replacements[bypass_letter.casefold()] = original_letter
+            elif bypass_letter:
+                self.multi_character_replacements.append(
+                    (bypass_letter.casefold(), original_letter)
+                )
+        self.table = _TranslationTable(self)
+
+    def fold_character(self, character: str) -> Optional[str]:
+        """
+        Returns what a single character translates to, or None if it should be stripped.
+        """
+        if character.isspace():
+            return character  # Kept so words still split the same way
+        folded = character.casefold()
+        if folded in self.letter_replacements:
+            return self._strip(self.letter_replacements[folded].lower()) or None
+        if folded in CONFUSABLES:
+            return CONFUSABLES[folded]
+
+        result = ""
+        for part in unicode_normalize("NFKD", folded):
+            if combining(part):
+                continue  # Accents and other diacritics
+            part = part.casefold()
+            part = self.letter_replacements.get(part, CONFUSABLES.get(part, part))
+            result += self._strip(part.lower())
+        return result or None
+
+    @staticmethod
+    def _strip(text: str) -> str:
+        return "".join(
+            character
+            for character in text
+            if character in ALLOWED_CHARACTERS or character.isspace()
+        )
+
+    def normalize(self, text: str) -> str:
+        for bypass_text, original_text in self.multi_character_replacements:
+            text = text.casefold().replace(bypass_text, original_text)
+        return text.translate(self.table)
+
+
+class WordFilter:
+    """
+    Normalizer and matcher compiled from one 'censor' config block. Built as a whole and only
+    then swapped in, so a reload never exposes a half-built filter.
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        words_startswith = cfg.get("words_startswith", [])
+        words_inside_words = cfg.get("words_inside_words", [])
+        words_independent = cfg.get("words_independent", [])
+
+        self.term_count = (
+            len(words_startswith) + len(words_inside_words) + len(words_independent)
+        )
+        self.text_normalizer = TextNormalizer(cfg.get("letter_replacements", {}))
+        self.word_matcher = WordMatcher(
+            words_startswith, words_inside_words, words_independent
+        )
+
+    def normalize(self, text: str) -> str:
+        return self.text_normalizer.normalize(text)
+
+    def matches(self, normalized_text: str) -> bool:
+        return self.word_matcher.matches(normalized_text)